@@ -1,3 +1,5 @@
+import argparse
+import os
 import sys
 
 import numpy as np
@@ -5,36 +7,99 @@ import vtk
 from PyQt6 import uic, QtWidgets
 from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QIcon
-from PyQt6.QtWidgets import QFileDialog
+from PyQt6.QtWidgets import QFileDialog, QLabel
 from vtk import vtkInteractorStyleTrackballCamera
 from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
-from vtkmodules.util.numpy_support import vtk_to_numpy
+
+from mesh_exporter import MeshExporter
+from series_loader import SeriesLoader
+from slice_animator import SliceAnimator
+from surface_refiner import SurfaceRefiner
+from utils.brush import Brush, merge_extents, stroke_path
+from utils.frame_timer import FrameTimeCounter
+from utils.iso_surface import LIVER_ISO_VALUE, MeshCache, extract_iso_surface, surface_key
+from utils.volume_cache import VolumeCache
+from utils.volume_mapper import (RENDER_BACKENDS, TARGET_INTERACTIVE_FPS, create_volume_mapper,
+                                 resolve_render_backend, set_volume_quality)
+from utils.vtk_volume import vtk_volume_array
+
+# Правки кисти показываются не чаще одного рендера за это время (~60 кадров/с)
+BRUSH_FRAME_MS = 16
 
 
 class MainWindow(QtWidgets.QMainWindow):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, render_backend=None, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
+        # gpu, cpu, smart или auto (выбор по наличию аппаратного OpenGL)
+        self.render_backend = render_backend or os.environ.get("LIVER_APP_RENDER_BACKEND", "auto")
+        self.resolved_render_backend = None
+        self.interacting = False
         self.reader2 = None
         self.actor = None
 
         self.body_data = None
         self.liver_data = None
-
-        self.mapper = None
-        self.volume = None
+        # NumPy-виды (z, y, x) на те же буферы, что и у body_data/liver_data, без копий:
+        # кисть пишет в liver_array и берёт значения добавленных вокселей из body_array
+        self.body_array = None
+        self.liver_array = None
+        # Маска печени liver_mask (uint8 0/1 для VTK и булев вид на тот же буфер).
+        # По ней считаются объёмы, изоповерхность и экспорт; кисть правит её вместе с liver_data
+        self.liver_mask_data = None
+        self.liver_mask = None
+
+        # Кисть для правки печени: режим переключается клавишами 1/2, 0/Esc — навигация
+        self.brush = None
+        self.drawing_mode = None
+        self.painting = False
+        self.last_stroke_voxel = None
+        self.pending_brush_extent = None
+        self.last_brush_extent = None
+        self.picker = vtk.vtkVolumePicker()
+        # Таблица накопленных сумм и посрезовый индекс маски печени (строятся в SeriesLoader)
+        # и правки, сделанные до их готовности
+        self.liver_table = None
+        self.liver_slices = None
+        self.liver_edits_extent = None
+        self.loader = None
+        self.mesh_exporter = None
+        self.volume_cache = VolumeCache()
+
+        # Граф лучевого рендеринга: строится один раз на загрузку (render_ray_casting)
+        self.mapper1 = self.volume_property1 = self.volume1 = None
+        self.mapper2 = self.volume_property2 = self.volume2 = None
 
         self.bounds = None
         self.slicing_planes = None
+        self.clipping_planes = None
+
+        # Режим изоповерхности: LRU-кэш сеток и фоновые потоки уточнения
+        self.mesh_cache = MeshCache()
+        self.surface_refiners = {}
+        self.displayed_surfaces = []
+        self.body_surface_actor = None
+        self.liver_surface_actor = None
 
         self.init_ui()
 
-        # Добавляем обработчик нажатия левой кнопки мыши для рисования кистью
         self.render_window_interactor.AddObserver("KeyPressEvent", self.on_key_press)
 
-        self.render_window_interactor.AddObserver("LeftButtonPressEvent", self.on_left_button_press)
-
-        self.render_window_interactor.SetInteractorStyle(vtkInteractorStyleTrackballCamera())
+        self.interactor_style = vtkInteractorStyleTrackballCamera()
+        self.render_window_interactor.SetInteractorStyle(self.interactor_style)
+        # Обработчики мыши для рисования кистью. Наблюдатель на стиле заменяет его
+        # встроенную реакцию, поэтому вне мазка события передаются стилю явно
+        self.interactor_style.AddObserver("LeftButtonPressEvent", self.on_left_button_press)
+        self.interactor_style.AddObserver("MouseMoveEvent", self.on_mouse_move)
+        self.interactor_style.AddObserver("LeftButtonReleaseEvent", self.on_left_button_release)
+        self.brush_render_timer = QTimer(self)
+        self.brush_render_timer.setSingleShot(True)
+        self.brush_render_timer.setInterval(BRUSH_FRAME_MS)
+        self.brush_render_timer.timeout.connect(self.flush_brush_render)
+        # Во время вращения рендерим с пониженным качеством, по отпусканию — с полным
+        self.render_window_interactor.SetDesiredUpdateRate(TARGET_INTERACTIVE_FPS)
+        self.interactor_style.AddObserver("StartInteractionEvent", self.on_interaction_start)
+        self.interactor_style.AddObserver("EndInteractionEvent", self.on_interaction_end)
 
     ###############################################################################################
     #                                   UI Initialization                                         #
@@ -56,11 +121,15 @@ class MainWindow(QtWidgets.QMainWindow):
         self.vtk_widget = QVTKRenderWindowInteractor(self.ui.viewWidget)
         self.ui.loadButton.clicked.connect(self.load_dicom_folder)
         self.ui.renderButton.clicked.connect(self.render_volume)
+        self.ui.exportMeshAction.triggered.connect(self.export_liver_mesh)
+        self.ui.profileAction.triggered.connect(self.show_liver_profile)
 
         self.ui.iso_slider.setMinimum(1)
         self.ui.iso_slider.setMaximum(255)
         self.ui.iso_slider.setValue(50)
         self.ui.iso_slider.valueChanged.connect(self.update_iso_value)
+        # По отпусканию слайдера грубая поверхность заменяется полной
+        self.ui.iso_slider.sliderReleased.connect(self.update_iso_value)
 
         self.set_slider_properties(self.ui.ambientSlider, self.ui.diffuseSlider, self.ui.specularSlider)
 
@@ -70,6 +139,20 @@ class MainWindow(QtWidgets.QMainWindow):
         self.render_window_interactor = self.vtk_widget.GetRenderWindow().GetInteractor()
         self.render_window = self.vtk_widget.GetRenderWindow()
 
+        # Счётчик времени кадров для оценки задержки при взаимодействии
+        self.frame_counter = FrameTimeCounter()
+        self.frame_counter.attach(self.render_window)
+        self.frame_time_label = QLabel()
+        self.statusBar().addPermanentWidget(self.frame_time_label)
+        self.frame_time_timer = QTimer(self)
+        self.frame_time_timer.timeout.connect(self.update_frame_time_label)
+        self.frame_time_timer.start(500)
+
+        # Анимация плоскости среза: темп подстраивается под время кадра, во время вращения тики пропускаются
+        self.plane_actor = None
+        self.slice_animator = SliceAnimator(self.frame_counter, self, is_busy=lambda: self.interacting or self.painting)
+        self.slice_animator.position_changed.connect(self.update_slicing_plane)
+
         # Режим рендеринга: ray casting по умолчанию
         self.ui.rayCastRadio.setChecked(True)
         self.ui.realTimeCheck.setChecked(True)
@@ -79,6 +162,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.hide_surface_widgets()
 
+    def update_frame_time_label(self):
+        if self.frame_counter.times:
+            self.frame_time_label.setText(self.frame_counter.summary())
+
     def show_surface_widgets(self):
         self.ui.iso_slider.show()
         self.ui.isoValue.show()
@@ -140,42 +227,80 @@ class MainWindow(QtWidgets.QMainWindow):
         folder1 – для исходного объёма (для лучевого рендеринга),
         folder2 – для редактирования (операции кисти будут изменять только этот объект).
         Таким образом, луч (при ray casting) будет проходить через данные из folder1.
+        Чтение идёт в фоновом потоке (SeriesLoader), окно остаётся отзывчивым.
         """
-        if self.actor:
-            self.renderer.RemoveActor(self.actor)
-        self.renderer.RemoveAllViewProps()
-
         # Задаём фиксированные пути к папкам (закомментирован вызов диалога)
         folder_dialog = QFileDialog.getExistingDirectory(self, "Выберите папку с снимками DICOM")
         folder1 = r"DICOM_DATASET"
         folder2 = r"DICOM_MASKED"
 
-        # Загрузка исходного объёма из folder1 (для лучевого рендеринга)
-        self.reader1 = vtk.vtkDICOMImageReader()
-        self.reader1.SetDirectoryName(folder1)
-        self.reader1.Update()
-        self.body_data = vtk.vtkImageData()
-        self.body_data.DeepCopy(self.reader1.GetOutput())
-
-        # Загрузка редактируемого объекта из folder2 (для операций кистью)
-        self.reader2 = vtk.vtkDICOMImageReader()
-        self.reader2.SetDirectoryName(folder2)
-        self.reader2.Update()
-        self.liver_data = vtk.vtkImageData()
-        self.liver_data.DeepCopy(self.reader2.GetOutput())
-
-        # Для первичного отображения используем 2D-актер, привязанный к данным из folder1
-        self.mapper = vtk.vtkImageMapper()
-        self.mapper.SetInputConnection(self.reader1.GetOutputPort())
-        self.actor = vtk.vtkActor2D()
-        self.actor.SetMapper(self.mapper)
-        self.renderer.AddActor(self.actor)
+        self.cancel_loading()
+
+        self.loader = SeriesLoader(folder1, folder2, self, volume_cache=self.volume_cache)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.body_loaded.connect(self.on_body_loaded)
+        self.loader.liver_loaded.connect(self.on_liver_loaded)
+        self.loader.liver_index_ready.connect(self.on_liver_index_ready)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.start()
+
+    def cancel_loading(self):
+        """
+        Отменяет текущую фоновую загрузку; её результаты уже не попадут в окно.
+        """
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader.wait()
+            self.loader = None
+
+    def on_load_progress(self, name, done, total):
+        self.statusBar().showMessage(f"Загрузка {name}: {done}/{total} срезов")
+
+    def on_load_failed(self, message):
+        self.statusBar().showMessage(f"Ошибка загрузки: {message}")
+        print("Ошибка загрузки:", message)
+
+    def on_body_loaded(self, body_data):
+        """
+        Исходный объём готов: подменяем данные и сразу рендерим, не дожидаясь маски печени.
+        """
+        if self.sender() is not self.loader:
+            return
+        if self.actor:
+            self.renderer.RemoveActor(self.actor)
+        self.renderer.RemoveAllViewProps()
+        self.reset_ray_casting_pipeline()
+        self.mesh_cache.clear()
+        self.slice_animator.pause()
+        self.plane_actor = None
+        self.displayed_surfaces = []
+
+        self.body_data = body_data
+        self.body_array = vtk_volume_array(body_data)
+        self.liver_data = None
+        self.liver_array = None
+        self.liver_mask_data = None
+        self.liver_mask = None
+        self.brush = None
+        self.painting = False
+        self.last_stroke_voxel = None
+        self.pending_brush_extent = None
+        self.liver_table = None
+        self.liver_slices = None
+        self.liver_edits_extent = None
+
+        # Порог изоповерхности — в диапазоне значений серии (HU)
+        low, high = body_data.GetScalarRange()
+        self.ui.iso_slider.blockSignals(True)
+        self.ui.iso_slider.setRange(int(low), int(high))
+        self.ui.iso_slider.blockSignals(False)
+        self.iso_value = self.ui.iso_slider.value()
+        self.ui.isoValue.setText(f"ISO Value: {self.iso_value}")
 
         # Рендерим объём и настраиваем окно
         self.render_volume()
         self.vtk_widget.resize(self.ui.viewWidget.size())
         self.renderer.ResetCamera()
-        self.render_window.Render()
 
         # Получаем камеру
         camera = self.renderer.GetActiveCamera()
@@ -197,14 +322,92 @@ class MainWindow(QtWidgets.QMainWindow):
         # Обновляем обрезку (важно!)
         self.renderer.ResetCameraClippingRange()
 
-        self.render_ray_casting()
+        self.render_window.Render()
+
+    def on_liver_loaded(self, liver_data, mask_data, background_value):
+        if self.sender() is not self.loader:
+            return
+        self.liver_data = liver_data
+        self.liver_array = vtk_volume_array(liver_data)
+        self.liver_mask_data = mask_data
+        self.liver_mask = vtk_volume_array(mask_data).view(bool)
+        self.brush = None
+        if self.body_array.shape == self.liver_array.shape:
+            self.brush = Brush(self.liver_mask, self.liver_array, self.body_array, background_value, radius=10)
+            self.statusBar().showMessage("Загрузка завершена", 3000)
+        else:
+            self.statusBar().showMessage("Размеры серий не совпадают: кисть недоступна", 5000)
+        self.render_volume()
+
+    def export_liver_mesh(self):
+        """
+        Сохраняет поверхность печени (с правками кистью) в STL/PLY/OBJ в фоновом потоке.
+        """
+        if not self.liver_data:
+            self.statusBar().showMessage("Печень ещё не загружена", 3000)
+            return
+        if self.mesh_exporter is not None and self.mesh_exporter.isRunning():
+            self.statusBar().showMessage("Экспорт уже выполняется", 3000)
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт сетки печени", "liver.stl",
+                                              "STL (*.stl);;PLY (*.ply);;OBJ (*.obj)")
+        if not path:
+            return
+
+        # Кисть пишет в маску из GUI-потока: экспорт работает с копией на момент нажатия
+        snapshot = vtk.vtkImageData()
+        snapshot.DeepCopy(self.liver_mask_data)
+        self.mesh_exporter = MeshExporter(snapshot, LIVER_ISO_VALUE, path, parent=self)
+        self.mesh_exporter.exported.connect(
+            lambda path, triangles: self.statusBar().showMessage(f"Сетка сохранена: {path} ({triangles} треугольников)"))
+        self.mesh_exporter.failed.connect(lambda message: self.statusBar().showMessage(f"Ошибка экспорта: {message}"))
+        self.statusBar().showMessage("Экспорт сетки печени...")
+        self.mesh_exporter.start()
+
+    def on_liver_index_ready(self, table, slices):
+        """
+        Индексы строились по данным на момент загрузки: правки кистью, сделанные
+        за это время, переносим в них по их экстенту.
+        """
+        if self.sender() is not self.loader:
+            return
+        if self.liver_edits_extent is not None:
+            self.update_liver_index(table, slices, self.liver_edits_extent)
+            self.liver_edits_extent = None
+        self.liver_table = table
+        self.liver_slices = slices
+
+    def update_liver_index(self, table, slices, extent):
+        i0, i1, j0, j1, k0, k1 = extent
+        table.update(extent, self.liver_mask[k0:k1 + 1, j0:j1 + 1, i0:i1 + 1])
+        # Статистика среза зависит от всего среза, поэтому пересчитываем затронутые срезы целиком
+        slices.refresh(self.liver_mask, k0, k1)
+
+    def show_liver_profile(self):
+        """
+        Показывает профиль площади печени по срезам (из посрезового индекса).
+        """
+        if self.liver_slices is None:
+            self.statusBar().showMessage("Индекс печени ещё не готов", 3000)
+            return
+        import matplotlib.pyplot as plt
 
+        self.liver_slices.plot_profile(origin_z=self.liver_data.GetOrigin()[2])
+        plt.show(block=False)
+
+    def closeEvent(self, event):
+        self.cancel_loading()
+        if self.mesh_exporter is not None:
+            self.mesh_exporter.wait()
+        for refiner in list(self.surface_refiners.values()):
+            refiner.wait()
+        super(MainWindow, self).closeEvent(event)
 
     def render_volume(self):
         """
         Выбирает режим рендеринга и вызывает соответствующий метод.
         """
-        if self.reader:
+        if self.body_data:
             if self.ui.surfaceRadio.isChecked():
                 print(2)
                 self.show_surface_widgets()
@@ -214,53 +417,91 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.hide_surface_widgets()
                 self.render_ray_casting()
 
-    def render_iso_surface(self):
+    def iso_surface_mesh(self, data, iso_value, coarse):
         """
-        Рендерит изоповерхность с помощью vtkMarchingCubes.
+        Изоповерхность из кэша; уточнённая (сглаженная и прореженная) версия предпочтительнее.
+        Если её нет, строится полная и в фоне запускается уточнение.
         """
-        if self.reader:
-            camera = self.renderer.GetActiveCamera()
-            position = camera.GetPosition()
-            focal_point = camera.GetFocalPoint()
-
-            marching_cubes = vtk.vtkMarchingCubes()
-            marching_cubes.SetInputConnection(self.reader.GetOutputPort())
-            marching_cubes.SetValue(0, self.ui.iso_slider.value())
-
-            mapper = vtk.vtkPolyDataMapper()
-            mapper.SetInputConnection(marching_cubes.GetOutputPort())
+        if coarse:
+            key = surface_key(data, iso_value, "coarse")
+            mesh = self.mesh_cache.get(key)
+            if mesh is None:
+                mesh = extract_iso_surface(data, iso_value, coarse=True)
+                self.mesh_cache.put(key, mesh)
+            return mesh
+
+        refined = self.mesh_cache.get(surface_key(data, iso_value, "refined"))
+        if refined is not None:
+            return refined
+        key = surface_key(data, iso_value, "full")
+        mesh = self.mesh_cache.get(key)
+        if mesh is None:
+            mesh = extract_iso_surface(data, iso_value)
+            self.mesh_cache.put(key, mesh)
+        self.start_surface_refinement(surface_key(data, iso_value, "refined"), mesh)
+        return mesh
+
+    def start_surface_refinement(self, key, mesh):
+        if key in self.surface_refiners:
+            return
+        refiner = SurfaceRefiner(key, mesh, self)
+        refiner.refined.connect(self.on_surface_refined)
+        refiner.failed.connect(lambda message: print("Ошибка уточнения поверхности:", message))
+        refiner.finished.connect(lambda: self.surface_refiners.pop(key, None))
+        self.surface_refiners[key] = refiner
+        refiner.start()
+
+    def on_surface_refined(self, key, mesh):
+        self.mesh_cache.put(key, mesh)
+        # Подменяем сетку, только если на экране всё ещё та же поверхность
+        for data, iso_value, actor in self.displayed_surfaces:
+            if surface_key(data, iso_value, "refined") == key:
+                actor.GetMapper().SetInputData(mesh)
+                self.render_window.Render()
+
+    def create_surface_actor(self, color, opacity):
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.ScalarVisibilityOff()
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetColor(*color)
+        actor.GetProperty().SetOpacity(opacity)
+        return actor
 
-            actor = vtk.vtkActor()
-            actor.SetMapper(mapper)
+    def render_iso_surface(self):
+        """
+        Рендерит изоповерхности vtkFlyingEdges3D: тело по порогу со слайдера и печень.
+        Пока слайдер тянут, показывается грубая поверхность по уменьшенному объёму.
+        """
+        if self.body_data:
+            coarse = self.ui.iso_slider.isSliderDown()
+            if self.body_surface_actor is None:
+                self.body_surface_actor = self.create_surface_actor((0.9, 0.8, 0.7), 0.4)
+                self.liver_surface_actor = self.create_surface_actor((1.0, 0.0, 0.0), 1.0)
 
-            # Создаём копию актора со сдвигом (для примера)
-            copy_actor = vtk.vtkActor()
-            copy_actor.SetMapper(mapper)
-            transform = vtk.vtkTransform()
-            transform.Translate(100, 0, 0)
-            copy_actor.SetUserTransform(transform)
+            surfaces = [(self.body_data, self.ui.iso_slider.value(), self.body_surface_actor)]
+            if self.liver_data:
+                surfaces.append((self.liver_mask_data, LIVER_ISO_VALUE, self.liver_surface_actor))
+            self.displayed_surfaces = surfaces
 
+            if hasattr(self, 'box_widget'):
+                self.box_widget.Off()
             self.renderer.RemoveAllViewProps()
-            self.renderer.AddActor(actor)
-            self.renderer.AddActor(copy_actor)
-
-            camera.SetPosition(position)
-            camera.SetFocalPoint(focal_point)
+            for data, iso_value, actor in surfaces:
+                actor.GetMapper().SetInputData(self.iso_surface_mesh(data, iso_value, coarse))
+                self.renderer.AddActor(actor)
             self.render_window.Render()
 
-    def calculate_liver_volume(self, threshold=50):
+    def calculate_liver_volume(self):
         """
-        Вычисляет объём красного тела по заданному пороговому значению интенсивности.
-        :param threshold: пороговое значение, выше которого воксель считается принадлежащим красной области.
-        :return: объём красного тела (например, в мм³, если spacing в мм)
+        Вычисляет объём печени — вокселей маски liver_mask (всё, кроме фона маскированной серии).
+        :return: объём печени (например, в мм³, если spacing в мм)
         """
-        # Получаем скалярное поле редактируемого объёма (красного тела)
-        scalars = self.liver_data.GetPointData().GetScalars()
-        # Преобразуем данные в массив NumPy
-        np_scalars = vtk_to_numpy(scalars)
-
-        # Подсчитываем число вокселей, где интенсивность >= threshold
-        red_voxel_count = np.count_nonzero(np_scalars >= threshold)
+        # По таблице накопленных сумм, пока она не готова — прямым подсчётом по маске
+        if self.liver_table is not None:
+            red_voxel_count = self.liver_table.total()
+        else:
+            red_voxel_count = np.count_nonzero(self.liver_mask)
 
         # Получаем параметры spacing (размеры вокселя)
         spacing = self.liver_data.GetSpacing()  # (dx, dy, dz)
@@ -284,7 +525,6 @@ class MainWindow(QtWidgets.QMainWindow):
         bounds = self.body_data.GetBounds()  # (xmin, xmax, ymin, ymax, zmin, zmax)
         xmin, xmax, ymin, ymax, zmin, zmax = bounds
         self.slice_z_position = zmin
-        self.slice_direction = 1  # 1 – движение вверх, -1 – вниз
 
         self.plane_source = vtk.vtkPlaneSource()
         self.plane_source.SetOrigin(xmin, ymin, self.slice_z_position)
@@ -302,12 +542,21 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.renderer.AddActor(self.plane_actor)
 
-        # Запускаем таймер для анимации среза
-        self.slice_timer = QTimer(self)
-        self.slice_timer.timeout.connect(self.update_slicing_plane)
-        self.slice_timer.start(20)  # обновление каждые 100 мс
+        # Запускаем анимацию среза: следующий тик взводится только после отрисовки кадра
+        self.slice_animator.configure(zmin, zmax)
+        self.slice_animator.seek(zmin)
+        self.slice_animator.start()
 
-    def calculate_visible_slice_volume(self, threshold=50):
+    def toggle_slice_animation(self):
+        """
+        Запуск / пауза анимации плоскости среза (клавиша a — при первом нажатии создаёт плоскость).
+        """
+        if self.plane_actor is None:
+            self.init_slicing_plane()
+        else:
+            self.slice_animator.toggle()
+
+    def calculate_visible_slice_volume(self):
         """
         Вычисляет объем печени только для видимых вокселей в пределах текущих границ (bounding box).
         """
@@ -315,18 +564,11 @@ class MainWindow(QtWidgets.QMainWindow):
             print("No liver data to calculate volume")
             return 0.0
 
-        # Получаем скалярные данные среза
-        scalars = self.liver_data.GetPointData().GetScalars()
-        np_scalars = vtk_to_numpy(scalars)
-
         # Получаем параметры среза и области
         origin = self.liver_data.GetOrigin()
         spacing = self.liver_data.GetSpacing()
         dims = self.liver_data.GetDimensions()
 
-        # Преобразуем одномерный массив в трехмерный
-        np_scalars_3d = np_scalars.reshape(dims[2], dims[1], dims[0])
-
         # Вычисляем объем одного вокселя
         voxel_volume = spacing[0] * spacing[1] * spacing[2]
 
@@ -349,8 +591,12 @@ class MainWindow(QtWidgets.QMainWindow):
         izmin = max(izmin, 0)
         izmax = min(izmax, dims[2])
 
-        # Подсчитываем количество видимых вокселей в пределах этих границ
-        visible_voxel_count = np.count_nonzero(np_scalars_3d[izmin:izmax, iymin:iymax, ixmin:ixmax] >= threshold)
+        # Подсчитываем количество видимых вокселей маски в пределах этих границ: по таблице
+        # накопленных сумм за O(1), пока она не готова — прямым подсчётом
+        if self.liver_table is not None:
+            visible_voxel_count = self.liver_table.box_sum(izmin, izmax, iymin, iymax, ixmin, ixmax)
+        else:
+            visible_voxel_count = np.count_nonzero(self.liver_mask[izmin:izmax, iymin:iymax, ixmin:ixmax])
 
         # Общий объем = количество видимых вокселей * объем одного вокселя
         total_volume = visible_voxel_count * voxel_volume
@@ -364,185 +610,222 @@ class MainWindow(QtWidgets.QMainWindow):
         print(f"Объем печени на видимом срезе: {round(volume_in_cubic_centimeters, 4)} cc")
         return total_volume
 
-    def update_slicing_plane(self):
-
-        bounds = self.body_data.GetBounds()
-        zmin = bounds[4]
-        zmax = bounds[5]
-        delta = (zmax - zmin) / 100.0 / 5  # шаг перемещения
-
-        self.slice_z_position += delta * self.slice_direction
-
-        if self.slice_z_position >= zmax:
-            self.slice_z_position = zmax
-            self.slice_direction = -1
-        elif self.slice_z_position <= zmin:
-            self.slice_z_position = zmin
-            self.slice_direction = 1
+    def show_slice_plane_readout(self):
+        if self.liver_slices is None:
+            return
+        k = self.liver_slices.slice_at(self.slice_z_position, self.liver_data.GetOrigin()[2])
+        area = self.liver_slices.area_mm2(k) / 100.0
+        below = self.liver_slices.slab_volume_mm3(0, k + 1) / 1000.0
+        self.ui.square.setText(f"Площадь печени на срезе {k}: {round(area, 2)} см^2, ниже среза: {round(below, 1)} см^3")
 
-        xmin, xmax, ymin, ymax, _, _ = bounds
+    def update_slicing_plane(self, z_position):
+        """
+        Переносит плоскость среза на z_position (сигнал SliceAnimator) и перерисовывает окно.
+        Показания под плоскостью берутся из посрезового индекса; объём в box-виджете от
+        плоскости не зависит и пересчитывается только при изменении границ.
+        """
+        if self.plane_actor is None:
+            return
+        self.slice_z_position = z_position
+        xmin, xmax, ymin, ymax, _, _ = self.body_data.GetBounds()
         self.plane_source.SetOrigin(xmin, ymin, self.slice_z_position)
         self.plane_source.SetPoint1(xmax, ymin, self.slice_z_position)
         self.plane_source.SetPoint2(xmin, ymax, self.slice_z_position)
-        self.plane_source.Update()
 
         # Обновляем положение clipping plane для синего объёма
         if hasattr(self, 'clipping_plane'):
             self.clipping_plane.SetOrigin(xmin, ymin, self.slice_z_position)
 
-        print('UPDATE SLICING PLANE')
+        # Смена режима рендеринга убирает все акторы со сцены
+        if not self.renderer.HasViewProp(self.plane_actor):
+            self.renderer.AddActor(self.plane_actor)
 
-        # Вычисление объема для видимых вокселей на текущем срезе
-        self.calculate_visible_slice_volume()
+        # Площадь печени на срезе под плоскостью и объём ниже неё — из посрезового индекса
+        self.show_slice_plane_readout()
 
         self.render_window.Render()
 
-    def render_ray_casting(self):
-        if self.body_data and self.liver_data:
-            camera = self.renderer.GetActiveCamera()
-            position = camera.GetPosition()
-            focal_point = camera.GetFocalPoint()
-
-            if self.bounds:
-                self.slicing_planes = []
-                # x y z pairs
-                x_min, x_max, y_min, y_max, z_min, z_max = self.bounds
-
-                slicing_z_min = vtk.vtkPlane()
-                slicing_z_min.SetOrigin(0, 0, z_min)
-                slicing_z_min.SetNormal(0, 0, 1)
-                self.slicing_planes.append(slicing_z_min)
-
-                slicing_z_max = vtk.vtkPlane()
-                slicing_z_max.SetOrigin(0, 0, z_max)
-                slicing_z_max.SetNormal(0, 0, -1)
-                self.slicing_planes.append(slicing_z_max)
-
-                slicing_y_min = vtk.vtkPlane()
-                slicing_y_min.SetOrigin(0, y_min, 0)
-                slicing_y_min.SetNormal(0, 1, 0)
-                self.slicing_planes.append(slicing_y_min)
-
-                slicing_y_max = vtk.vtkPlane()
-                slicing_y_max.SetOrigin(0, y_max, 0)
-                slicing_y_max.SetNormal(0, -1, 0)
-                self.slicing_planes.append(slicing_y_max)
-
-                slicing_x_min = vtk.vtkPlane()
-                slicing_x_min.SetOrigin(x_min, 0, 0)
-                slicing_x_min.SetNormal(1, 0, 0)
-                self.slicing_planes.append(slicing_x_min)
-
-                slicing_x_max = vtk.vtkPlane()
-                slicing_x_max.SetOrigin(x_max, 0, 0)
-                slicing_x_max.SetNormal(-1, 0, 0)
-                self.slicing_planes.append(slicing_x_max)
-
-            # Объём 1: Исходный (folder1) – синий оттенок
-            mapper1 = vtk.vtkGPUVolumeRayCastMapper()
-            mapper1.SetInputData(self.body_data)
-            if self.slicing_planes:
-                for plane in self.slicing_planes:
-                    mapper1.AddClippingPlane(plane)
-
-            volume_property1 = vtk.vtkVolumeProperty()
-
-            color_transfer1 = vtk.vtkColorTransferFunction()
-
-            intensities = [-643.78106689453125, -584.65887451171875, -382.65924072265625, -237.65838623046875,
-                           -75.40606689453125, 114.5941162109375, 316.5936279296875, 461.59375]
-
-            colors = [
-                (0.0, 0.0, 0.0),  # черный
-                (1.0, 0.0, 0.0),  # красный
-                (1.0, 0.99920654296875, 0.0),  # желтый
-                (1.0, 1.0, 1.0),  # белый
-                (0.0, 0.0, 0.0),  # черный снова
-
-                # (0, 1, 0),
-                # (0, 1, 1),
-
-                (1.0, 0.0, 0.0),  # красный снова
-                (1.0, 0.99920654296875, 0.0),  # желтый снова
-                (1.0, 1.0, 1.0)  # белый снова
-            ]
-
-            for intensity, color in zip(intensities, colors):
-                r, g, b = color
-                color_transfer1.AddRGBPoint(intensity, r, g, b)
-
-            volume_property1.SetColor(color_transfer1)
-
-            scalar_opacity = vtk.vtkPiecewiseFunction()
-
-            # Данные из XML:
-            opacity_points = [
-                (-643.78106689453125, 0.0),
-                (-584.65887451171875, 0.26931655406951904),
-                (-382.65924072265625, 0.46969130635261536),
-                (-237.65838623046875, 0.51899993419647217),
-                (-75.40606689453125, 0.0),
-
-                # (40, 1.0),
-                # (80, 1.0),
-
-                (114.5941162109375, 0.27931660413742065),
-                (316.5936279296875, 0.28899994492530823),
-                (461.59375, 0.28899994492530823)
-            ]
-
-            for intensity, opacity in opacity_points:
-                scalar_opacity.AddPoint(intensity, opacity)
-
-            volume_property1.SetScalarOpacity(scalar_opacity)
-            #volume_property1.SetGradientOpacity(self.gradient_opacity_transfer_function())
-            volume_property1.SetInterpolationTypeToLinear()
-            volume_property1.ShadeOn()
-            volume_property1.SetAmbient(self.ui.ambientSlider.value() / 10.0)
-            volume_property1.SetDiffuse(self.ui.diffuseSlider.value() / 10.0)
-            volume_property1.SetSpecular(self.ui.specularSlider.value() / 10.0)
-            volume1 = vtk.vtkVolume()
-            volume1.SetMapper(mapper1)
-            volume1.SetProperty(volume_property1)
-
-            mapper2 = vtk.vtkGPUVolumeRayCastMapper()
-            mapper2.SetInputData(self.liver_data)
-            if self.slicing_planes:
-                for plane in self.slicing_planes:
-                    mapper2.AddClippingPlane(plane)
-            volume_property2 = vtk.vtkVolumeProperty()
-            color_transfer2 = vtk.vtkColorTransferFunction()
-            color_transfer2.AddRGBPoint(0, 1, 0, 0)  # красный
-            color_transfer2.AddRGBPoint(1000, 1, 0, 0)
-            volume_property2.SetColor(color_transfer2)
-            volume_property2.SetScalarOpacity(self.scalar_opacity_transfer_function())
-            volume_property2.SetGradientOpacity(self.gradient_opacity_transfer_function())
-            volume_property2.SetInterpolationTypeToLinear()
-            volume_property2.ShadeOn()
-            volume_property2.SetAmbient(self.ui.ambientSlider.value() / 10.0)
-            volume_property2.SetDiffuse(self.ui.diffuseSlider.value() / 10.0)
-            volume_property2.SetSpecular(self.ui.specularSlider.value() / 10.0)
-            volume2 = vtk.vtkVolume()
-            volume2.SetMapper(mapper2)
-            volume2.SetProperty(volume_property2)
+    def create_slicing_planes(self):
+        """
+        Шесть плоскостей отсечения по граням box-виджета (x y z пары), общие для обоих объёмов.
+        Создаются один раз; при движении рамки у них меняется только origin.
+        """
+        normals = [(0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0), (1, 0, 0), (-1, 0, 0)]
+        self.slicing_planes = []
+        self.clipping_planes = vtk.vtkPlaneCollection()
+        for normal in normals:
+            plane = vtk.vtkPlane()
+            plane.SetNormal(*normal)
+            self.slicing_planes.append(plane)
+            self.clipping_planes.AddItem(plane)
+
+    def update_slicing_planes(self):
+        """
+        Сдвигает плоскости отсечения к текущим границам self.bounds.
+        """
+        if not self.bounds:
+            return
+        if self.slicing_planes is None:
+            self.create_slicing_planes()
+        x_min, x_max, y_min, y_max, z_min, z_max = self.bounds
+        origins = [(0, 0, z_min), (0, 0, z_max), (0, y_min, 0), (0, y_max, 0), (x_min, 0, 0), (x_max, 0, 0)]
+        for plane, origin in zip(self.slicing_planes, origins):
+            plane.SetOrigin(*origin)
+        for mapper in (self.mapper1, self.mapper2):
+            if mapper and mapper.GetClippingPlanes() is not self.clipping_planes:
+                mapper.SetClippingPlanes(self.clipping_planes)
+
+    def update_volume_lighting(self):
+        """
+        Переносит значения слайдеров освещения в существующие свойства объёмов.
+        """
+        for volume_property in (self.volume_property1, self.volume_property2):
+            if volume_property:
+                volume_property.SetAmbient(self.ui.ambientSlider.value() / 10.0)
+                volume_property.SetDiffuse(self.ui.diffuseSlider.value() / 10.0)
+                volume_property.SetSpecular(self.ui.specularSlider.value() / 10.0)
 
+    def reset_ray_casting_pipeline(self):
+        """
+        Сбрасывает граф рендеринга; он будет построен заново для новых данных.
+        """
+        self.mapper1 = self.volume_property1 = self.volume1 = None
+        self.mapper2 = self.volume_property2 = self.volume2 = None
+        self.bounds = None
 
-            self.renderer.RemoveAllViewProps()
-            self.renderer.AddVolume(volume1)
-            self.renderer.AddVolume(volume2)
+    def create_volume_mapper(self, data):
+        """
+        Маппер выбранного бэкенда; бэкенд определяется один раз, при первом построении.
+        """
+        if self.resolved_render_backend is None:
+            self.resolved_render_backend = resolve_render_backend(self.render_backend, self.render_window)
+            print("Бэкенд объёмного рендеринга:", self.resolved_render_backend)
+        mapper = create_volume_mapper(self.resolved_render_backend)
+        mapper.SetInputData(data)
+        set_volume_quality(mapper, data.GetSpacing(), self.interacting)
+        return mapper
+
+    def set_interacting(self, interacting):
+        self.interacting = interacting
+        for mapper, data in ((self.mapper1, self.body_data), (self.mapper2, self.liver_data)):
+            if mapper:
+                set_volume_quality(mapper, data.GetSpacing(), interacting)
+
+    def on_interaction_start(self, caller, event):
+        self.set_interacting(True)
+
+    def on_interaction_end(self, caller, event):
+        self.set_interacting(False)
+        self.render_window.Render()
 
-            # Восстанавливаем положение камеры
-            camera.SetPosition(position)
-            camera.SetFocalPoint(focal_point)
-            if hasattr(self, 'box_widget'):
-                self.box_widget.SetInteractor(self.render_window_interactor)
-                self.box_widget.SetRepresentation(self.box_rep)
-                self.box_widget.On()
-                self.renderer.AddViewProp(self.box_rep)
-            self.render_window.Render()
+    def build_body_volume(self):
+        """
+        Объём 1: Исходный (folder1) – синий оттенок. Строится один раз на загрузку.
+        """
+        self.mapper1 = self.create_volume_mapper(self.body_data)
+
+        volume_property1 = vtk.vtkVolumeProperty()
+
+        color_transfer1 = vtk.vtkColorTransferFunction()
+
+        intensities = [-643.78106689453125, -584.65887451171875, -382.65924072265625, -237.65838623046875,
+                       -75.40606689453125, 114.5941162109375, 316.5936279296875, 461.59375]
+
+        colors = [
+            (0.0, 0.0, 0.0),  # черный
+            (1.0, 0.0, 0.0),  # красный
+            (1.0, 0.99920654296875, 0.0),  # желтый
+            (1.0, 1.0, 1.0),  # белый
+            (0.0, 0.0, 0.0),  # черный снова
+
+            # (0, 1, 0),
+            # (0, 1, 1),
+
+            (1.0, 0.0, 0.0),  # красный снова
+            (1.0, 0.99920654296875, 0.0),  # желтый снова
+            (1.0, 1.0, 1.0)  # белый снова
+        ]
+
+        for intensity, color in zip(intensities, colors):
+            r, g, b = color
+            color_transfer1.AddRGBPoint(intensity, r, g, b)
+
+        volume_property1.SetColor(color_transfer1)
+
+        scalar_opacity = vtk.vtkPiecewiseFunction()
+
+        # Данные из XML:
+        opacity_points = [
+            (-643.78106689453125, 0.0),
+            (-584.65887451171875, 0.26931655406951904),
+            (-382.65924072265625, 0.46969130635261536),
+            (-237.65838623046875, 0.51899993419647217),
+            (-75.40606689453125, 0.0),
+
+            # (40, 1.0),
+            # (80, 1.0),
+
+            (114.5941162109375, 0.27931660413742065),
+            (316.5936279296875, 0.28899994492530823),
+            (461.59375, 0.28899994492530823)
+        ]
 
-            self.volume1 = volume1
-            #self.volume2 = volume2
+        for intensity, opacity in opacity_points:
+            scalar_opacity.AddPoint(intensity, opacity)
+
+        volume_property1.SetScalarOpacity(scalar_opacity)
+        #volume_property1.SetGradientOpacity(self.gradient_opacity_transfer_function())
+        volume_property1.SetInterpolationTypeToLinear()
+        volume_property1.ShadeOn()
+        self.volume_property1 = volume_property1
+
+        self.volume1 = vtk.vtkVolume()
+        self.volume1.SetMapper(self.mapper1)
+        self.volume1.SetProperty(volume_property1)
+
+    def build_liver_volume(self):
+        """
+        Объём 2: печень (folder2) – может ещё грузиться в фоне.
+        """
+        self.mapper2 = self.create_volume_mapper(self.liver_data)
+        volume_property2 = vtk.vtkVolumeProperty()
+        color_transfer2 = vtk.vtkColorTransferFunction()
+        color_transfer2.AddRGBPoint(0, 1, 0, 0)  # красный
+        color_transfer2.AddRGBPoint(1000, 1, 0, 0)
+        volume_property2.SetColor(color_transfer2)
+        volume_property2.SetScalarOpacity(self.scalar_opacity_transfer_function())
+        volume_property2.SetGradientOpacity(self.gradient_opacity_transfer_function())
+        volume_property2.SetInterpolationTypeToLinear()
+        volume_property2.ShadeOn()
+        self.volume_property2 = volume_property2
+
+        self.volume2 = vtk.vtkVolume()
+        self.volume2.SetMapper(self.mapper2)
+        self.volume2.SetProperty(volume_property2)
+
+    def render_ray_casting(self):
+        """
+        Рендерит объёмы лучевым методом. Граф (мапперы, свойства, плоскости) строится
+        один раз на загрузку, дальше меняются только параметры, и текстуры
+        не загружаются в GPU заново.
+        """
+        if self.body_data:
+            if self.volume1 is None:
+                self.build_body_volume()
+            if self.liver_data and self.volume2 is None:
+                self.build_liver_volume()
+
+            self.update_volume_lighting()
+            self.update_slicing_planes()
+
+            # После смены режима (изоповерхность) объёмы могли быть убраны со сцены
+            for actor in (self.body_surface_actor, self.liver_surface_actor):
+                if actor:
+                    self.renderer.RemoveActor(actor)
+            self.displayed_surfaces = []
+            for prop in (self.volume1, self.volume2):
+                if prop and not self.renderer.HasViewProp(prop):
+                    self.renderer.AddVolume(prop)
 
             if not hasattr(self, 'box_widget'):
                 self.box_rep = vtk.vtkBoxRepresentation()
@@ -558,6 +841,14 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.box_widget.TranslationEnabledOff()  # Запрет перемещения центра
                 self.box_widget.RotationEnabledOff()  # Запрет вращения
                 self.box_widget.AddObserver("InteractionEvent", self.on_bounding_box_update)
+                self.box_widget.AddObserver("StartInteractionEvent", self.on_interaction_start)
+                self.box_widget.AddObserver("EndInteractionEvent", self.on_interaction_end)
+            elif not self.renderer.HasViewProp(self.box_rep):
+                self.box_rep.PlaceWidget(self.bounds or self.volume1.GetBounds())
+                self.renderer.AddViewProp(self.box_rep)
+                self.box_widget.On()
+
+            self.render_window.Render()
 
     def on_bounding_box_update(self, caller, event):
         bounds = caller.GetRepresentation().GetBounds()
@@ -598,74 +889,107 @@ class MainWindow(QtWidgets.QMainWindow):
     #                          Brush (editing model with mouse) Functions                         #
     ###############################################################################################
 
-    def on_left_button_press(self, obj, event):
+    def pick_world_position(self):
         """
-        Обработчик левого клика мыши.
-        Использует vtkVolumePicker для определения мировой координаты клика,
-        затем вызывает изменение интенсивности вокселей.
-        """
-        click_pos = self.render_window_interactor.GetEventPosition()
-        print("Click position (screen):", click_pos)
-        picker = vtk.vtkVolumePicker()
-        picker.Set
-        picker.Pick(click_pos[0], click_pos[1], 0, self.renderer)
-        pick_position = picker.GetPickPosition()
-        print("Picked world coordinates:", pick_position)
-        if pick_position != (0.0, 0.0, 0.0):
-            self.brush_stroke_at_position(pick_position)
-        obj.InvokeEvent("LeftButtonPressEvent")
+        Мировая координата точки объёма под курсором или None, если луч ничего не задел.
+        """
+        event_pos = self.render_window_interactor.GetEventPosition()
+        if not self.picker.Pick(event_pos[0], event_pos[1], 0, self.renderer):
+            return None
+        return self.picker.GetPickPosition()
 
-    def brush_stroke_at_position(self, world_coord):
+    def on_left_button_press(self, obj, event):
         """
-        Преобразует мировые координаты в индексы вокселей для self.liver_data и увеличивает их интенсивность.
+        Обработчик левого клика мыши.
+        В режиме кисти (клавиши 1/2) клик по объёму начинает мазок, который продолжается
+        при движении мыши; иначе клик обрабатывает стиль камеры (вращение).
         """
-        if not self.liver_data:
+        if self.drawing_mode and self.liver_data:
+            pick_position = self.pick_world_position()
+            if pick_position is not None:
+                self.painting = True
+                self.last_stroke_voxel = None
+                self.brush_stroke_at_position(pick_position)
+                return
+        self.interactor_style.OnLeftButtonDown()
+
+    def on_mouse_move(self, obj, event):
+        if self.painting:
+            pick_position = self.pick_world_position()
+            if pick_position is not None:
+                self.brush_stroke_at_position(pick_position)
             return
+        self.interactor_style.OnMouseMove()
 
-        # Используем мировые координаты напрямую
-        local_coord = world_coord
+    def on_left_button_release(self, obj, event):
+        if self.painting:
+            self.painting = False
+            self.last_stroke_voxel = None
+            self.flush_brush_render()
+            return
+        self.interactor_style.OnLeftButtonUp()
 
+    def world_to_voxel(self, world_coord):
+        """
+        Индексы вокселя (i, j, k) self.liver_data для мировой координаты или None вне объёма.
+        """
         # Получаем параметры изображения
         origin = self.liver_data.GetOrigin()
         spacing = self.liver_data.GetSpacing()
-        dims = self.liver_data.GetDimensions()
 
         # Преобразуем мировые координаты в индексы вокселей
-        i = int((local_coord[0] - origin[0]) / spacing[0])
-        j = int((local_coord[1] - origin[1]) / spacing[1])
-        k = int((local_coord[2] - origin[2]) / spacing[2])
+        i = int((world_coord[0] - origin[0]) / spacing[0])
+        j = int((world_coord[1] - origin[1]) / spacing[1])
+        k = int((world_coord[2] - origin[2]) / spacing[2])
 
         # Проверяем, что индексы в пределах допустимого диапазона
         extent = self.liver_data.GetExtent()  # (xmin, xmax, ymin, ymax, zmin, zmax)
         if i < extent[0] or i > extent[1] or j < extent[2] or j > extent[3] or k < extent[4] or k > extent[5]:
+            return None
+        return i, j, k
+
+    def brush_stroke_at_position(self, world_coord):
+        """
+        Правит маску печени кистью: add добавляет воксели (в liver_data — значения исходной КТ),
+        remove убирает (в liver_data — фон). Между предыдущим и текущим положением мазка
+        штампы ставятся с шагом в половину радиуса; рендер откладывается до следующего кадра.
+        """
+        if not self.liver_data or self.brush is None:
+            return
+
+        voxel = self.world_to_voxel(world_coord)
+        if voxel is None:
             print("Picked voxel is out of bounds")
             return
 
-        # Задаём радиус кисти (в вокселях)
-        brush_radius = 10
-        intensity_increment = 200.0  # увеличение интенсивности
+        mode = self.drawing_mode or 'add'
+        for center in stroke_path(self.last_stroke_voxel, voxel, max(self.brush.radius / 2, 1)):
+            self.pending_brush_extent = merge_extents(self.pending_brush_extent, self.brush.stroke(*center, mode))
+        self.last_stroke_voxel = voxel
+        self.schedule_brush_render()
 
-        # Получаем скалярное поле
-        scalars = self.liver_data.GetPointData().GetScalars()
-        if not scalars:
-            print("No scalar data in image")
-            return
+    def schedule_brush_render(self):
+        """
+        Правки кисти копятся и показываются не чаще одного рендера за кадр (BRUSH_FRAME_MS).
+        """
+        if not self.brush_render_timer.isActive():
+            self.brush_render_timer.start()
 
-        # Проходим по вокселям в пределах заданного куба
-        for kk in range(max(k - brush_radius, extent[4]), min(k + brush_radius + 1, extent[5] + 1)):
-            for jj in range(max(j - brush_radius, extent[2]), min(j + brush_radius + 1, extent[3] + 1)):
-                for ii in range(max(i - brush_radius, extent[0]), min(i + brush_radius + 1, extent[1] + 1)):
-                    # Проверяем, находится ли воксель внутри сферы кисти
-                    dist = ((ii - i)**2 + (jj - j)**2 + (kk - k)**2)**0.5
-                    if dist <= brush_radius:
-                        index = ii + (jj * dims[0]) + (kk * dims[0] * dims[1])
-                        curr_val = scalars.GetTuple1(index)
-                        new_val = curr_val + intensity_increment
-                        scalars.SetTuple1(index, new_val)
-        scalars.Modified()
-        self.liver_data.Modified()
-        if self.mapper:
-            self.mapper.Modified()
+    def flush_brush_render(self):
+        self.brush_render_timer.stop()
+        if self.pending_brush_extent is None:
+            return
+        self.last_brush_extent = self.pending_brush_extent
+        self.pending_brush_extent = None
+
+        # MTime массива скаляров входит в MTime liver_data: маппер и кэш поверхностей увидят правку.
+        # GPU-маппер VTK не умеет дозагружать часть 3D-текстуры и обновит её целиком
+        self.liver_data.GetPointData().GetScalars().Modified()
+        self.liver_mask_data.GetPointData().GetScalars().Modified()
+        if self.liver_table is not None:
+            self.update_liver_index(self.liver_table, self.liver_slices, self.last_brush_extent)
+        else:
+            self.liver_edits_extent = merge_extents(self.liver_edits_extent, self.last_brush_extent)
         self.render_window.Render()
 
     def on_key_press(self, obj, event):
@@ -677,9 +1001,30 @@ class MainWindow(QtWidgets.QMainWindow):
         elif key == '2':
             self.drawing_mode = 'remove'  # Режим удаления
             print("Mode switched to Remove")
-
-        if key.lower() == 'v':
-            self.on_left_button_press(obj, event)
+        elif key in ('0', 'Escape'):
+            self.drawing_mode = None  # Кисть выключена, мышь вращает камеру
+            print("Mode switched to Navigate")
+
+        # Анимация плоскости среза: a — запуск/пауза, стрелки — шаг, Home/End — к краям объёма
+        if key == 'a' and self.body_data:
+            self.toggle_slice_animation()
+        elif self.plane_actor is not None:
+            if key == 'space':
+                self.slice_animator.toggle()
+            elif key in ('Right', 'Up', 'Left', 'Down'):
+                self.slice_animator.pause()
+                self.slice_animator.step(1 if key in ('Right', 'Up') else -1)
+            elif key == 'Home':
+                self.slice_animator.seek(self.slice_animator.z_min)
+            elif key == 'End':
+                self.slice_animator.seek(self.slice_animator.z_max)
+
+        if key.lower() == 'v' and self.liver_data:
+            # Одиночный штамп под курсором
+            pick_position = self.pick_world_position()
+            if pick_position is not None:
+                self.last_stroke_voxel = None
+                self.brush_stroke_at_position(pick_position)
 
     ###############################################################################################
     #                                  Key Event Handling                                         #
@@ -689,9 +1034,14 @@ class MainWindow(QtWidgets.QMainWindow):
         super(MainWindow, self).keyPressEvent(event)
 
 def main():
-    app = QtWidgets.QApplication([])
+    parser = argparse.ArgumentParser(description="Просмотр КТ и сегментации печени")
+    parser.add_argument("--render-backend", choices=RENDER_BACKENDS,
+                        help="бэкенд объёмного рендеринга (по умолчанию $LIVER_APP_RENDER_BACKEND или auto)")
+    args, qt_args = parser.parse_known_args()
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     # app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt6())
-    main_window = MainWindow()
+    main_window = MainWindow(render_backend=args.render_backend)
     main_window.show()
     sys.exit(app.exec())
 
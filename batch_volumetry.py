@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from model.model import BACKENDS
+from utils.dicom_series import list_dicom_files
+from utils.label_map import LABEL_BACKGROUND, LABEL_NAMES, has_label_map
+from utils.volume_cache import VOLUME_CACHE_DIR
+from utils.volumetry import VolumetryCache, find_studies, measure_study
+
+OUTPUT_FORMATS = ("csv", "jsonl")
+# Колонки CSV на каждую именованную метку; прочие метки попадают только в JSON Lines
+LABEL_COLUMNS = ("voxels", "volume_ml", "surface_mm2")
+# study — всегда исходная папка исследования; label_map — карта меток, построенная в режиме --segment
+STUDY_COLUMNS = ["study", "status", "source", "label_map", "cached", "segment_seconds", "seconds", "error"]
+CSV_COLUMNS = STUDY_COLUMNS + [
+    f"{name}_{column}" for name, value in LABEL_NAMES.items() if value != LABEL_BACKGROUND for column in LABEL_COLUMNS]
+
+
+def measure_study_safe(folder, threshold=None, cache_dir=VOLUME_CACHE_DIR):
+    """
+    Волюметрия одного исследования в процессе пула; ошибка исследования возвращается
+    в результате и не прерывает ночной прогон.
+    """
+    start_time = time.time()
+    try:
+        result = measure_study(folder, threshold, VolumetryCache(cache_dir) if cache_dir else None)
+        result["status"] = "ok"
+    except Exception as e:
+        result = {"study": os.path.abspath(folder), "status": "error", "error": f"{type(e).__name__}: {e}",
+                  "seconds": round(time.time() - start_time, 3)}
+    return result
+
+
+def study_masks_dir(folder, masks_root):
+    """
+    Папка карты меток исследования: имя папки плюс хэш абсолютного пути, чтобы
+    исследования с одинаковым именем (например, /p1/CT и /p2/CT) не делили одну карту.
+    """
+    folder = os.path.abspath(folder)
+    key = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(masks_root, f"{os.path.basename(os.path.normpath(folder))}_{key}")
+
+
+def segment_study(folder, masks_root, force=False, **segment_options):
+    """
+    Сегментирует серию в карту меток study_masks_dir(folder, masks_root); готовая карта переиспользуется.
+    :return: (папка с картой меток, время сегментации в секундах или 0.0)
+    """
+    # Модель и её зависимости нужны только в режиме сегментации
+    from process_dicom import segment_series
+    from utils.label_map import write_series_label_map
+
+    output_dir = study_masks_dir(folder, masks_root)
+    if has_label_map(output_dir) and not force:
+        return output_dir, 0.0
+    start_time = time.time()
+    masks = segment_series(folder, output_dir, write_masked=False, **segment_options)
+    write_series_label_map(list_dicom_files(folder), masks, output_dir)
+    return output_dir, round(time.time() - start_time, 3)
+
+
+class ResultWriter:
+    """
+    Построчная запись результатов в CSV или JSON Lines по мере готовности.
+    put() вызывается из потоков обратного вызова пула, поэтому запись под блокировкой.
+    """
+
+    def __init__(self, stream, output_format):
+        self.stream = stream
+        self.output_format = output_format
+        self.failed = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(stream, CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    @staticmethod
+    def csv_row(result):
+        row = {name: result.get(name) for name in STUDY_COLUMNS}
+        for name, stats in result.get("labels", {}).items():
+            for column in LABEL_COLUMNS:
+                row[f"{name}_{column}"] = stats[column]
+        return row
+
+    def put(self, result):
+        with self._lock:
+            if self._csv is not None:
+                self._csv.writerow(self.csv_row(result))
+            else:
+                self.stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.stream.flush()
+            self.written += 1
+            self.failed += result["status"] != "ok"
+
+
+def run_batch(folders, writer, workers=None, threshold=None, cache_dir=VOLUME_CACHE_DIR, masks_root=None,
+              force=False, **segment_options):
+    """
+    Волюметрия списка исследований в пуле процессов с потоковой записью результатов.
+
+    Без masks_root исследования должны уже содержать маски (карту меток liver_labels или
+    маскированную серию). С masks_root серии сначала сегментируются в текущем процессе
+    (модель загружается один раз, segment_series сам распределяет подготовку срезов по
+    пулу), а готовые карты меток сразу уходят в пул волюметрии.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(folder, labels_folder=None, segment_seconds=None):
+            future = pool.submit(measure_study_safe, labels_folder or folder, threshold, cache_dir)
+
+            def done(finished):
+                try:
+                    result = finished.result()
+                except Exception as e:
+                    # Процесс пула упал (BrokenProcessPool и т. п.): исключение из обратного
+                    # вызова пул проглотил бы, и исследование осталось бы без строки
+                    result = {"study": os.path.abspath(folder), "status": "error",
+                              "error": f"{type(e).__name__}: {e}"}
+                # Строку результата привязываем к исходной папке, а не к папке карты меток
+                result["study"] = os.path.abspath(folder)
+                if labels_folder is not None:
+                    result["label_map"] = os.path.abspath(labels_folder)
+                    result["segment_seconds"] = segment_seconds
+                writer.put(result)
+            future.add_done_callback(done)
+
+        for folder in folders:
+            if masks_root is None:
+                submit(folder)
+                continue
+            try:
+                labels_folder, segment_seconds = segment_study(folder, masks_root, force, **segment_options)
+            except Exception as e:
+                writer.put({"study": os.path.abspath(folder), "status": "error",
+                            "error": f"{type(e).__name__}: {e}"})
+                continue
+            submit(folder, labels_folder, segment_seconds)
+
+
+def expand_studies(folders):
+    """
+    Раскрывает папки с папками исследований; несуществующие пути остаются как есть
+    и попадают в результаты со статусом error.
+    """
+    return [study for folder in folders for study in (find_studies(folder) if os.path.isdir(folder) else [folder])]
+
+
+def read_folder_list(path):
+    """
+    Папки исследований из файла по одной на строку («-» — stdin); пустые строки и # пропускаются.
+    """
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith("#")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетная волюметрия печени по списку исследований без GUI")
+    parser.add_argument("folders", nargs="*",
+                        help="папки исследований или папки с папками исследований")
+    parser.add_argument("-l", "--list", help="файл со списком папок по одной на строку («-» — stdin)")
+    parser.add_argument("-o", "--output", help="файл результатов .csv или .jsonl (по умолчанию stdout)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS,
+                        help="формат вывода (по умолчанию по расширению --output, иначе jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="число процессов пула")
+    parser.add_argument("--threshold", type=float,
+                        help="порог интенсивности для маскированных серий без карты меток")
+    parser.add_argument("--segment", metavar="MASKS_DIR",
+                        help="сегментировать исходные серии, карты меток писать в MASKS_DIR/<исследование>_<хэш пути>")
+    parser.add_argument("--force", action="store_true", help="сегментировать заново, даже если карта меток есть")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help="бэкенд инференса для --segment")
+    parser.add_argument("--no-cache", action="store_true", help="не читать и не писать кэш результатов")
+    args = parser.parse_args()
+
+    study_folders = expand_studies(args.folders + (read_folder_list(args.list) if args.list else []))
+    output_format = args.format or (os.path.splitext(args.output)[1].lstrip(".").lower() if args.output else "jsonl")
+    if output_format not in OUTPUT_FORMATS:
+        parser.error(f"неизвестный формат {output_format}, ожидается один из {OUTPUT_FORMATS}")
+
+    batch_start = time.time()
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        result_writer = ResultWriter(output, output_format)
+        extra = {"backend": args.backend} if args.segment else {}
+        # Сегментация, запись карт меток и загрузка модели печатают прогресс в stdout;
+        # уводим его в stderr, чтобы поток результатов оставался чистым CSV / JSON Lines
+        with contextlib.redirect_stdout(sys.stderr):
+            run_batch(study_folders, result_writer, args.workers, args.threshold,
+                      None if args.no_cache else VOLUME_CACHE_DIR, args.segment, args.force, **extra)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Исследований: {result_writer.written}, с ошибкой: {result_writer.failed}, "
+          f"{round(time.time() - batch_start, 2)}с", file=sys.stderr)
+    sys.exit(1 if result_writer.failed else 0)
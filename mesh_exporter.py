@@ -0,0 +1,27 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from utils.mesh_export import DEFAULT_TARGET_TRIANGLES, export_surface
+
+
+class MeshExporter(QThread):
+    """
+    Экспортирует поверхность печени в файл в фоновом потоке.
+    exported(path, triangles) приходит в GUI-поток после записи файла.
+    image должен быть собственной копией объёма: поток читает его без блокировок.
+    """
+    exported = pyqtSignal(str, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, image, iso_value, path, target_triangles=DEFAULT_TARGET_TRIANGLES, parent=None):
+        super().__init__(parent)
+        self.image = image
+        self.iso_value = iso_value
+        self.path = path
+        self.target_triangles = target_triangles
+
+    def run(self):
+        try:
+            triangles = export_surface(self.image, self.iso_value, self.path, self.target_triangles)
+            self.exported.emit(self.path, triangles)
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -1,13 +1,124 @@
+import sys
+import threading
 import time
+from collections import namedtuple
 from pathlib import Path
-from ultralytics import YOLO
 
-start_time = time.time()
+import numpy as np
 
-path = Path(__file__).parent / "best (10).pt"
-model = YOLO(path)
+DEFAULT_WEIGHTS = Path(__file__).parent / "best (10).pt"
+DEFAULT_ONNX_WEIGHTS = DEFAULT_WEIGHTS.with_suffix(".onnx")
+BACKENDS = ("torch", "onnx")
 
-end_time = time.time()
-loading_time = end_time - start_time
+# Результат сегментации одного изображения, общий для всех бэкендов:
+# masks — (K, H, W) bool, confidences — (K,) float, class_ids — (K,) int
+Detections = namedtuple("Detections", ["masks", "confidences", "class_ids"])
 
-print(f'Модель загружена за {round(loading_time, 3)}с')
+# Один экземпляр модели на процесс для каждого файла весов
+_models = {}
+_models_lock = threading.Lock()
+_metrics_hook = None
+
+
+def empty_detections(size=(640, 640)):
+    return Detections(
+        masks=np.zeros((0, size[1], size[0]), dtype=bool),
+        confidences=np.zeros(0, dtype=np.float32),
+        class_ids=np.zeros(0, dtype=np.int64),
+    )
+
+
+def print_metrics(metrics):
+    """
+    Хук метрик по умолчанию: печатает время загрузки и пик памяти.
+    """
+    message = f'Модель загружена за {round(metrics["load_time"], 3)}с'
+    if metrics["warmup_time"] is not None:
+        message += f', прогрев {round(metrics["warmup_time"], 3)}с'
+    if metrics["peak_memory_mb"] is not None:
+        message += f', пик памяти {round(metrics["peak_memory_mb"], 1)} МБ'
+    print(message)
+
+
+def set_metrics_hook(hook):
+    """
+    Задаёт функцию, которая получает словарь метрик загрузки модели:
+    event, backend, weights, load_time, warmup_time, peak_memory_mb.
+    :param hook: callable(dict) или None для вывода через print_metrics
+    """
+    global _metrics_hook
+    _metrics_hook = hook
+
+
+def peak_memory_mb():
+    """
+    Пиковый RSS текущего процесса в мегабайтах или None, если платформа не поддерживает resource.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def _load_model(weights, warmup, backend):
+    start_time = time.time()
+    if backend == "onnx":
+        from model.onnx_backend import OnnxSegmentationModel
+        model = OnnxSegmentationModel(weights)
+    else:
+        # ultralytics тянет за собой torch, поэтому импортируем только при первой загрузке
+        from ultralytics import YOLO
+        model = YOLO(weights)
+    loading_time = time.time() - start_time
+
+    warmup_time = None
+    if warmup:
+        start_time = time.time()
+        model.predict(np.zeros((640, 640, 3), dtype=np.uint8), device="cpu", verbose=False)
+        warmup_time = time.time() - start_time
+
+    metrics = {
+        "event": "model_loaded",
+        "backend": backend,
+        "weights": str(weights),
+        "load_time": loading_time,
+        "warmup_time": warmup_time,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+    (_metrics_hook or print_metrics)(metrics)
+    return model
+
+
+def default_weights(backend="torch"):
+    return DEFAULT_ONNX_WEIGHTS if backend == "onnx" else DEFAULT_WEIGHTS
+
+
+def get_model(weights=None, warmup=False, backend="torch"):
+    """
+    Возвращает модель сегментации, загружая её при первом обращении.
+    Повторные вызовы в том же процессе возвращают тот же экземпляр.
+    :param weights: путь к весам (.pt для torch, .onnx для onnx); по умолчанию — веса из папки model
+    :param warmup: прогнать пустой кадр сразу после загрузки
+    :param backend: "torch" — ultralytics YOLO, "onnx" — OnnxSegmentationModel на ONNX Runtime
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный backend: {backend}, ожидается один из {BACKENDS}")
+    if weights is None:
+        weights = default_weights(backend)
+    key = (backend, str(weights))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = _load_model(weights, warmup, backend)
+        return _models[key]
+
+
+def __getattr__(name):
+    # Совместимость со старым `from model.model import model`
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,139 @@
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from model.model import DEFAULT_WEIGHTS, DEFAULT_ONNX_WEIGHTS, Detections, empty_detections
+
+# Те же значения по умолчанию, что и у ultralytics predict
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS = 30000
+
+
+def export_onnx(weights=DEFAULT_WEIGHTS, imgsz=640):
+    """
+    Экспортирует веса .pt в ONNX с динамической размерностью батча.
+    Файл .onnx создаётся рядом с .pt.
+    :return: путь к .onnx
+    """
+    from ultralytics import YOLO
+
+    start_time = time.time()
+    onnx_path = YOLO(weights).export(format="onnx", dynamic=True, imgsz=imgsz, simplify=True)
+    print(f'Экспорт в ONNX завершён за {round(time.time() - start_time, 3)}с: {onnx_path}')
+    return Path(onnx_path)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    Жадный NMS по боксам xyxy.
+    :return: индексы оставленных боксов по убыванию score
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def crop_masks(masks, boxes):
+    """
+    Обнуляет маски вне соответствующих боксов (координаты в пикселях масок).
+    """
+    _, h, w = masks.shape
+    x1, y1, x2, y2 = (boxes[:, i, None, None] for i in range(4))
+    cols = np.arange(w, dtype=np.float32)[None, None, :]
+    rows = np.arange(h, dtype=np.float32)[None, :, None]
+    return masks * ((cols >= x1) & (cols < x2) & (rows >= y1) & (rows < y2))
+
+
+class OnnxSegmentationModel:
+    """
+    YOLO-seg через ONNX Runtime на CPU: torch не импортируется,
+    NMS и декодирование масок (прототипы × коэффициенты, sigmoid, crop, upsample) — в NumPy.
+    """
+
+    def __init__(self, weights=DEFAULT_ONNX_WEIGHTS, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(weights), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def predict(self, images, device=None, verbose=False):
+        """
+        :param images: 640×640×3 uint8 изображение или список таких изображений
+        :return: список Detections для каждого изображения
+        """
+        if isinstance(images, np.ndarray) and images.ndim == 3:
+            images = [images]
+        batch = np.stack(images).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+        predictions, protos = self.session.run(None, {self.input_name: np.ascontiguousarray(batch)})
+        shape = batch.shape[2:]
+        return [self._decode(prediction, proto, shape) for prediction, proto in zip(predictions, protos)]
+
+    def _decode(self, prediction, protos, shape):
+        # prediction: (4 + nc + nm, anchors), protos: (nm, mh, mw)
+        nm = protos.shape[0]
+        prediction = prediction.T
+        boxes_xywh = prediction[:, :4]
+        scores_all = prediction[:, 4:-nm]
+        coefficients = prediction[:, -nm:]
+
+        class_ids = scores_all.argmax(axis=1)
+        scores = scores_all[np.arange(len(class_ids)), class_ids]
+        candidates = scores > self.conf_threshold
+        if not candidates.any():
+            return empty_detections((shape[1], shape[0]))
+
+        boxes_xywh = boxes_xywh[candidates]
+        scores = scores[candidates]
+        class_ids = class_ids[candidates]
+        coefficients = coefficients[candidates]
+        if len(scores) > MAX_NMS:
+            top = scores.argsort()[::-1][:MAX_NMS]
+            boxes_xywh, scores, class_ids, coefficients = boxes_xywh[top], scores[top], class_ids[top], coefficients[top]
+
+        boxes = np.empty_like(boxes_xywh)
+        boxes[:, :2] = boxes_xywh[:, :2] - boxes_xywh[:, 2:] / 2
+        boxes[:, 2:] = boxes_xywh[:, :2] + boxes_xywh[:, 2:] / 2
+
+        # NMS по классам: сдвигаем боксы разных классов, чтобы они не пересекались
+        offsets = class_ids[:, None].astype(np.float32) * max(shape)
+        keep = nms(boxes + offsets, scores, self.iou_threshold)[:MAX_DETECTIONS]
+        boxes = boxes[keep]
+        scores = scores[keep]
+        class_ids = class_ids[keep]
+        coefficients = coefficients[keep]
+
+        # Маски: коэффициенты × прототипы -> sigmoid -> crop -> upsample до входа модели
+        _, mh, mw = protos.shape
+        masks = sigmoid(coefficients @ protos.reshape(nm, -1)).reshape(-1, mh, mw)
+        scale = np.array([mw / shape[1], mh / shape[0], mw / shape[1], mh / shape[0]], dtype=np.float32)
+        masks = crop_masks(masks, boxes * scale)
+        upsampled = np.stack([cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+                              for mask in masks])
+        return Detections(masks=upsampled > 0.5, confidences=scores, class_ids=class_ids.astype(np.int64))
+
+
+if __name__ == "__main__":
+    export_onnx()
@@ -1,12 +1,28 @@
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pydicom
 from PIL import Image
 from PIL import ImageOps, ImageChops
 from dicom2jpg import dicom2img
+from pydicom.pixels import apply_modality_lut, apply_voi_lut
+from pydicom.uid import generate_uid
 
-from model.model import model
+from model.model import BACKENDS, Detections, default_weights, empty_detections, get_model
+from utils.dicom_series import list_dicom_files
+from utils.label_map import write_series_label_map
+from utils.manifest import SegmentationManifest, atomic_save_dataset
+from utils.mask_cache import MaskCache, file_fingerprint
+from utils.mask_resample import MaskResampler
 
+MODEL_INPUT_SIZE = (640, 640)
+DEFAULT_BATCH_SIZE = 16
 
 
 def show_masks_grid(images, cols=5):
@@ -23,106 +39,148 @@ def show_masks_grid(images, cols=5):
     plt.show()
 
 
-def find_dicom_files(folder_path):
-    find_dicom = []
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if file.lower().endswith(".dcm"):
-                find_dicom.append(os.path.join(root, file))
-    return find_dicom
+def _first_value(value):
+    # WindowCenter/WindowWidth могут храниться списком значений
+    if isinstance(value, pydicom.multival.MultiValue):
+        return float(value[0])
+    return float(value)
 
-import pydicom
-from pydicom.uid import generate_uid
 
+def pixels_to_uint8(ds, pixels):
+    """
+    Переводит уже декодированные пиксели среза в 8-бит так же, как dicom2img:
+    rescale slope/intercept -> окно (LINEAR_EXACT) -> min-max нормализация.
+    Повторно файл не читается.
+    """
+    data = pixels.astype(np.float64)
 
-import pydicom
-from pydicom.uid import generate_uid
-from pydicom.dataset import Dataset
-from skimage.transform import resize
-def process_dicom(file: os.PathLike, output_dir="DICOM_MASKED"):
+    # Modality LUT
+    if 'RescaleSlope' in ds and 'RescaleIntercept' in ds:
+        data = data * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+    else:
+        data = apply_modality_lut(data, ds)
+
+    # VOI LUT: окно center/width
+    if 'VOILUTFunction' in ds and ds.VOILUTFunction == 'SIGMOID':
+        data = apply_voi_lut(data, ds)
+    elif 'WindowCenter' in ds and 'WindowWidth' in ds:
+        center = _first_value(ds.WindowCenter)
+        width = _first_value(ds.WindowWidth)
+        low = center - width / 2
+        high = center + width / 2
+        data_min = data.min()
+        data_max = data.max()
+        windowed = (data - low) / width * (data_max - data_min) + data_min
+        data = np.where(data <= low, data_min, np.where(data > high, data_max, windowed))
+    else:
+        data = apply_voi_lut(data, ds)
+
+    # Min-max нормализация в 8 бит
+    data_range = data.max() - data.min()
+    if data_range == 0:
+        return np.zeros(data.shape, dtype=np.uint8)
+    data = (data - data.min()) / data_range * 255.0
+    if ds.get('PhotometricInterpretation') == "MONOCHROME1":
+        data = data.max() - data
+    return data.astype(np.uint8)
+
+
+def prepare_model_input(file: os.PathLike, use_dicom2img=False):
+    """
+    Читает DICOM и формирует 640×640 RGB-изображение для модели.
+    :param use_dicom2img: получать 8-битное превью через dicom2img (второе чтение файла)
+        вместо преобразования уже декодированных пикселей
+    :return: (ds, original_pixels, rgb)
+    """
     # 1) Читаем исходный DICOM
     ds = pydicom.dcmread(file)
     original_pixels = ds.pixel_array  # e.g. shape (H, W), dtype uint16
 
     # 2) Формируем 640×640 grayscale для модели
-    img_data = dicom2img(file)
+    if use_dicom2img:
+        img_data = dicom2img(file)
+    else:
+        img_data = pixels_to_uint8(ds, original_pixels)
     if img_data.ndim == 3:
         img_data = img_data[:, :, 0]
-    img_data = ((img_data - img_data.min()) / (img_data.max() - img_data.min()) * 255).astype(np.uint8)
+    img_range = float(img_data.max()) - float(img_data.min())
+    if img_range == 0:
+        # Однородный срез (pixels_to_uint8 уже вернул нули): делить на нулевой диапазон нельзя
+        img_data = np.zeros(img_data.shape, dtype=np.uint8)
+    else:
+        img_data = ((img_data - img_data.min()) / img_range * 255).astype(np.uint8)
     base_image = Image.fromarray(img_data).convert("L")
-    base_image = ImageOps.fit(base_image, (640, 640), Image.Resampling.LANCZOS)
+    base_image = ImageOps.fit(base_image, MODEL_INPUT_SIZE, Image.Resampling.LANCZOS)
     rgb = np.array(base_image.convert("RGB"))
 
-    # 3) Получаем маски от модели и собираем их в один слой
-    results = model.predict(rgb)
-    combined_mask = Image.new("L", base_image.size, 0)
-    if results[0].masks is not None:
-        for mask in results[0].masks.data.cpu().numpy():
-            m = (mask.astype(np.uint8) * 255)
-            combined_mask = ImageChops.lighter(combined_mask, Image.fromarray(m))
-
-    # 4) Преобразуем маску в булев массив и масштабируем обратно к исходному размеру
-    mask_arr_640 = (np.array(combined_mask) > 0).astype(np.uint8)
-    mask_resized = resize(
-        mask_arr_640,
-        original_pixels.shape,
-        order=0,           # nearest-neighbor, чтобы сохранить четкую границу
-        preserve_range=True,
-        anti_aliasing=False
-    ).astype(bool)
+    return ds, original_pixels, rgb
 
-    # 5) Применяем маску к оригинальным пикселям
-    masked_pixels = np.where(mask_resized, original_pixels, 0)
 
-    # 6) Обновляем PixelData, не трогаем BitsAllocated/BitsStored и т.д.
-    ds.PixelData = masked_pixels.tobytes()
-    # Rows/Columns в ds уже исходные, не нужно менять
-    # Генерим новый UID, чтобы не было дублирования
-    ds.SOPInstanceUID = generate_uid()
-    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+def result_detections(result, size=MODEL_INPUT_SIZE):
+    """
+    Переводит результат ultralytics в Detections: маски экземпляров (K, 640, 640),
+    уверенности (K,) и классы (K,). Если модель ничего не нашла, K = 0.
+    """
+    if result.masks is None:
+        return empty_detections(size)
+    return Detections(
+        masks=result.masks.data.cpu().numpy().astype(bool),
+        confidences=result.boxes.conf.cpu().numpy(),
+        class_ids=result.boxes.cls.cpu().numpy().astype(np.int64),
+    )
 
-    # Сохраняем
-    os.makedirs(output_dir, exist_ok=True)
-    out_path = os.path.join(output_dir, f"masked_{os.path.basename(file)}")
-    ds.save_as(out_path)
 
-    return out_path
+def predict_detections(images, backend="torch", device="cpu"):
+    """
+    Один вызов модели на список 640×640 RGB-изображений.
+    :param backend: "torch" (ultralytics) или "onnx" (ONNX Runtime, без torch)
+    :return: список Detections для каждого изображения
+    """
+    if backend == "onnx":
+        return get_model(backend="onnx").predict(images)
+    return [result_detections(result) for result in get_model().predict(images, device=device, verbose=False)]
 
 
-def process_dicom(file: os.PathLike, output_dir="DICOM_MASKED", return_preview=True):
-    # 1) Читаем исходный DICOM
-    ds = pydicom.dcmread(file)
-    original_pixels = ds.pixel_array  # e.g. shape (H, W), dtype uint16
+def fuse_masks(instance_masks):
+    """
+    Объединяет маски экземпляров (K, 640, 640) в одну булеву маску одним проходом.
+    """
+    # 3) Собираем маски от модели в один слой
+    return instance_masks.any(axis=0)
 
-    # 2) Формируем 640×640 grayscale для модели
-    img_data = dicom2img(file)
-    if img_data.ndim == 3:
-        img_data = img_data[:, :, 0]
-    img_data = ((img_data - img_data.min()) / (img_data.max() - img_data.min()) * 255).astype(np.uint8)
-    base_image = Image.fromarray(img_data).convert("L")
-    base_image = ImageOps.fit(base_image, (640, 640), Image.Resampling.LANCZOS)
-    rgb = np.array(base_image.convert("RGB"))
 
-    # 3) Получаем маски от модели и собираем их в один слой
-    results = model.predict(rgb)
-    combined_mask = Image.new("L", base_image.size, 0)
-    if results[0].masks is not None:
-        for mask in results[0].masks.data.cpu().numpy():
-            m = (mask.astype(np.uint8) * 255)
-            combined_mask = ImageChops.lighter(combined_mask, Image.fromarray(m))
-
-    # 4) Преобразуем маску в булев массив и масштабируем обратно к исходному размеру
-    mask_arr_640 = (np.array(combined_mask) > 0).astype(np.uint8)
-    mask_resized = resize(
-        mask_arr_640,
-        original_pixels.shape,
-        order=0,           # nearest-neighbor, чтобы сохранить четкую границу
-        preserve_range=True,
-        anti_aliasing=False
-    ).astype(bool)
+@lru_cache(maxsize=8)
+def get_mask_resampler(shape):
+    # Индексные карты считаются один раз на геометрию серии (в каждом процессе)
+    return MaskResampler(shape, MODEL_INPUT_SIZE)
+
+
+@lru_cache(maxsize=8)
+def get_mask_buffer(shape):
+    # Булев буфер маски исходного размера, один на геометрию серии (в каждом процессе)
+    return np.zeros(shape, dtype=bool)
+
+
+def combine_masks(instance_masks, shape, out=None):
+    """
+    Собирает маски экземпляров в одну 640×640 маску
+    и переносит её обратно на сетку исходного среза с учётом обрезки ImageOps.fit.
+    :param out: булев буфер формы shape (например, get_mask_buffer); результат
+        перезапишется следующим вызовом с тем же буфером
+    """
+    mask_arr_640 = fuse_masks(instance_masks)
+
+    # 4) Nearest-neighbour, чтобы сохранить четкую границу
+    return get_mask_resampler(tuple(shape))(mask_arr_640, out=out)
 
+
+def apply_mask(ds, original_pixels, mask):
+    """
+    Обнуляет пиксели вне маски и записывает их в ds (без сохранения на диск).
+    :return: masked_pixels
+    """
     # 5) Применяем маску к оригинальным пикселям
-    masked_pixels = np.where(mask_resized, original_pixels, 0)
+    masked_pixels = np.where(mask, original_pixels, 0)
 
     # 6) Обновляем PixelData, не трогаем BitsAllocated/BitsStored и т.д.
     ds.PixelData = masked_pixels.tobytes()
@@ -131,10 +189,36 @@ def process_dicom(file: os.PathLike, output_dir="DICOM_MASKED", return_preview=T
     ds.SOPInstanceUID = generate_uid()
     ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
 
-    # Сохраняем
+    return masked_pixels
+
+
+def masked_output_path(file: os.PathLike, output_dir="DICOM_MASKED"):
+    return os.path.join(output_dir, f"masked_{os.path.basename(file)}")
+
+
+def save_masked_dicom(ds, original_pixels, mask, file: os.PathLike, output_dir="DICOM_MASKED"):
+    """
+    Обнуляет пиксели вне маски и сохраняет срез как masked_<имя файла>.
+    :return: (путь к файлу, masked_pixels)
+    """
+    masked_pixels = apply_mask(ds, original_pixels, mask)
+
+    # Сохраняем атомарно, чтобы сбой не оставил недописанный срез
     os.makedirs(output_dir, exist_ok=True)
-    out_path = os.path.join(output_dir, f"masked_{os.path.basename(file)}")
-    ds.save_as(out_path)
+    out_path = masked_output_path(file, output_dir)
+    atomic_save_dataset(ds, out_path)
+
+    return out_path, masked_pixels
+
+
+def process_dicom(file: os.PathLike, output_dir="DICOM_MASKED", return_preview=True, use_dicom2img=False,
+                  backend="torch"):
+    ds, original_pixels, rgb = prepare_model_input(file, use_dicom2img)
+
+    detections = predict_detections([rgb], backend)[0]
+    mask = combine_masks(detections.masks, original_pixels.shape)
+
+    out_path, masked_pixels = save_masked_dicom(ds, original_pixels, mask, file, output_dir)
 
     # Для визуальной проверки: возвращаем PIL‑превью из masked_pixels
     if return_preview:
@@ -143,7 +227,373 @@ def process_dicom(file: os.PathLike, output_dir="DICOM_MASKED", return_preview=T
         return Image.fromarray(pv)
     else:
         return out_path
+
+
+def slice_cache_key(rgb, original_shape, model_id, backend, use_dicom2img):
+    # Хэшируем вход модели, а не сырые пиксели: он учитывает rescale, окно, VOI LUT
+    # и PhotometricInterpretation из заголовка; форма среза задаёт геометрию маски
+    return MaskCache.key(rgb, model_id, {
+        "backend": backend,
+        "use_dicom2img": use_dicom2img,
+        "input_size": MODEL_INPUT_SIZE,
+        "original_shape": tuple(original_shape),
+    })
+
+
+def model_version(backend="torch"):
+    return f"{backend}:{file_fingerprint(default_weights(backend))}"
+
+
+def lookup_cached_masks(prepared, cache, backend, use_dicom2img):
+    """
+    Ищет маски пачки срезов в кэше.
+    :param prepared: список (ds, original_pixels, rgb)
+    :return: (ключи кэша, маски из кэша или None для промахов)
+    """
+    if cache is None:
+        return [None] * len(prepared), [None] * len(prepared)
+    model_id = file_fingerprint(default_weights(backend))
+    keys = [slice_cache_key(rgb, original_pixels.shape, model_id, backend, use_dicom2img)
+            for _, original_pixels, rgb in prepared]
+    return keys, [cache.get(key) for key in keys]
+
+
+def predict_missing(prepared, cached_masks, backend="torch", device="cpu"):
+    """
+    Прогоняет через модель только срезы без маски в кэше (одним вызовом).
+    :return: Detections для каждого среза или None для попаданий в кэш
+    """
+    missing = [index for index, mask in enumerate(cached_masks) if mask is None]
+    batch_detections = [None] * len(prepared)
+    if missing:
+        predicted = predict_detections([prepared[index][2] for index in missing], backend, device)
+        for index, detections in zip(missing, predicted):
+            batch_detections[index] = detections
+    return batch_detections
+
+
+def finish_slice(ds, original_pixels, instance_masks=None, mask=None):
+    """
+    Постобработка одного среза после инференса (выполняется в пуле процессов):
+    объединение масок, масштабирование к исходному размеру и обнуление фона.
+    :param mask: готовая маска исходного размера (например, из кэша) вместо instance_masks
+    :return: (ds с обновлённым PixelData, булева маска); без ds — только маска
+    """
+    if mask is None:
+        # Результат пула сериализуется в основной процесс сразу при возврате,
+        # поэтому буфер процесса свободен для следующего среза
+        mask = combine_masks(instance_masks, original_pixels.shape, get_mask_buffer(tuple(original_pixels.shape)))
+    if ds is not None:
+        apply_mask(ds, original_pixels, mask)
+    return ds, mask
+
+
+class MaskedDicomWriter:
+    """
+    Фоновый поток, который сохраняет готовые срезы на диск по мере их появления,
+    не дожидаясь окончания обработки всей серии. Принимает future от finish_slice
+    и пишет срезы в порядке поступления; новые маски заодно кладёт в кэш.
+    Маски сохранённых срезов остаются в masks (файл -> маска), а сам future с ds
+    отпускается сразу после записи.
+    Если задан манифест, результат каждого среза записывается в него, а ошибки
+    не прерывают прогон.
+    """
+
+    def __init__(self, output_dir="DICOM_MASKED", cache=None, manifest=None, model_version=None):
+        self.output_dir = output_dir
+        self.cache = cache
+        self.manifest = manifest
+        self.model_version = model_version
+        self.error = None
+        self.masks = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        os.makedirs(output_dir, exist_ok=True)
+        self._thread.start()
+
+    def put(self, future, file: os.PathLike, cache_key=None):
+        """
+        :param cache_key: ключ MaskCache, под которым сохранить маску среза
+        """
+        self._queue.put((future, file, cache_key))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, file, cache_key = item
+            out_path = masked_output_path(file, self.output_dir)
+            try:
+                ds, mask = future.result()
+                atomic_save_dataset(ds, out_path)
+                if self.cache is not None and cache_key is not None:
+                    self.cache.put(cache_key, mask)
+            except Exception as e:
+                if self.manifest is not None:
+                    self.manifest.mark_failed(file, self.model_version, e)
+                # Запоминаем первую ошибку, остальные срезы продолжаем писать
+                elif self.error is None:
+                    self.error = e
+                continue
+            self.masks[file] = mask
+            if self.manifest is not None:
+                self.manifest.mark_done(file, out_path, self.model_version)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def segment_series(folder, output_dir="DICOM_MASKED", workers=None, batch_size=DEFAULT_BATCH_SIZE, device="cpu",
+                   use_dicom2img=False, backend="torch", return_detections=False, cache=None, manifest=None,
+                   write_masked=True):
+    """
+    Сегментирует серию из папки, распределяя декодирование, подготовку входа и
+    постобработку масок по пулу процессов. Инференс идёт пачками в текущем процессе,
+    пока пул готовит следующую пачку; готовые срезы сразу уходят в фоновый writer.
+    :param folder: папка с DICOM-файлами серии
+    :param workers: число процессов пула (по умолчанию — число ядер)
+    :param return_detections: дополнительно вернуть Detections каждого среза в порядке масок
+        (None для срезов, взятых из кэша)
+    :param cache: MaskCache; срезы с маской в кэше не проходят через модель
+    :param manifest: SegmentationManifest; обрабатываются только новые, изменённые и упавшие срезы,
+        ошибки отдельных срезов записываются в манифест и не прерывают прогон
+    :param write_masked: сохранять masked_*.dcm; без них остаются только маски (например, для карты меток)
+    :return: список булевых масок исходного размера для обработанных срезов в порядке list_dicom_files
+        (или (маски, detections) при return_detections). Без манифеста ошибка любого среза
+        поднимается, поэтому маски соответствуют файлам один к одному; с манифестом упавшие
+        срезы записываются в него и пропускаются
+    """
+    version = model_version(backend)
+    files = list_dicom_files(folder)
+    if manifest is not None:
+        files = manifest.filter_pending(files, version)
+    batches = [files[start:start + batch_size] for start in range(0, len(files), batch_size)]
+    workers = workers or os.cpu_count()
+    start_time = time.time()
+
+    # (файл, future с маской, ключ кэша для новой маски, Detections); future None — маску забирает writer
+    slice_results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            MaskedDicomWriter(output_dir, cache, manifest, version) as writer:
+        prepared_futures = [pool.submit(prepare_model_input, file, use_dicom2img) for file in batches[0]] \
+            if batches else []
+        for index, batch_files in enumerate(batches):
+            prepared = []
+            prepared_files = []
+            for file, future in zip(batch_files, prepared_futures):
+                try:
+                    prepared.append(future.result())
+                    prepared_files.append(file)
+                except Exception as e:
+                    if manifest is None:
+                        raise
+                    manifest.mark_failed(file, version, e)
+
+            # Пока идёт инференс, пул уже декодирует следующую пачку
+            if index + 1 < len(batches):
+                prepared_futures = [pool.submit(prepare_model_input, file, use_dicom2img)
+                                    for file in batches[index + 1]]
+
+            keys, cached_masks = lookup_cached_masks(prepared, cache, backend, use_dicom2img)
+            batch_detections = predict_missing(prepared, cached_masks, backend, device)
+
+            for file, (ds, original_pixels, _), detections, key, mask in zip(
+                    prepared_files, prepared, batch_detections, keys, cached_masks):
+                if not write_masked:
+                    ds = None
+                if mask is None:
+                    future = pool.submit(finish_slice, ds, original_pixels, detections.masks)
+                elif write_masked:
+                    future = pool.submit(finish_slice, ds, original_pixels, mask=mask)
+                else:
+                    future = Future()
+                    future.set_result((None, mask))
+                # В кэш кладём только новые маски, попадания уже в нём
+                new_key = key if mask is None else None
+                # Маски экземпляров (K, 640, 640) держим до конца серии, только если их просили
+                if not return_detections:
+                    detections = None
+                if write_masked:
+                    # ds с PixelData живёт, только пока срез не записан, а не до конца серии
+                    writer.put(future, file, new_key)
+                    slice_results.append((file, None, None, detections))
+                else:
+                    slice_results.append((file, future, new_key, detections))
+
+    # Detections добавляются вместе с маской, чтобы списки совпадали и при пропуске упавших срезов
+    masks = []
+    all_detections = []
+    for file, future, key, detections in slice_results:
+        if future is None:
+            # Без манифеста ошибка записи уже поднята в writer.close(), с манифестом — записана в него
+            if file not in writer.masks:
+                continue
+            mask = writer.masks.pop(file)
+        else:
+            try:
+                mask = future.result()[1]
+            except Exception as e:
+                if manifest is None:
+                    raise
+                manifest.mark_failed(file, version, e)
+                continue
+            if cache is not None and key is not None:
+                cache.put(key, mask)
+        masks.append(mask)
+        all_detections.append(detections)
+    if manifest is not None:
+        manifest.save()
+
+    elapsed = time.time() - start_time
+    throughput = len(files) / elapsed if elapsed > 0 else 0.0
+    print(f'Обработано {len(files)} срезов за {round(elapsed, 3)}с ({round(throughput, 2)} срезов/с, '
+          f'процессов: {workers})')
+    if cache is not None:
+        cache.print_stats()
+
+    if return_detections:
+        return masks, all_detections
+    return masks
+
+
+def mask_iou(mask_a, mask_b):
+    union = np.count_nonzero(mask_a | mask_b)
+    return np.count_nonzero(mask_a & mask_b) / union if union else 1.0
+
+
+def check_preprocessing_parity(files, device="cpu"):
+    """
+    Сравнивает путь через dicom2img с однократным декодированием:
+    входы модели должны совпадать побайтно, маски — по IoU.
+    :return: (число срезов с отличающимся входом, минимальный IoU масок)
+    """
+    input_mismatches = 0
+    min_iou = 1.0
+    for file in files:
+        _, original_pixels, rgb_fast = prepare_model_input(file)
+        _, _, rgb_ref = prepare_model_input(file, use_dicom2img=True)
+        if not np.array_equal(rgb_fast, rgb_ref):
+            input_mismatches += 1
+            print(f'Вход модели отличается: {file}, max |diff| = '
+                  f'{np.abs(rgb_fast.astype(np.int16) - rgb_ref).max()}')
+
+        detections = predict_detections([rgb_fast, rgb_ref], device=device)
+        mask_fast = combine_masks(detections[0].masks, original_pixels.shape)
+        mask_ref = combine_masks(detections[1].masks, original_pixels.shape)
+        min_iou = min(min_iou, mask_iou(mask_fast, mask_ref))
+
+    print(f'Срезов с отличающимся входом: {input_mismatches} из {len(files)}, минимальный IoU масок: {round(min_iou, 4)}')
+    return input_mismatches, min_iou
+
+
+def check_backend_parity(files, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Сравнивает маски ONNX-бэкенда с масками ultralytics на одних и тех же входах.
+    :return: (средний IoU, минимальный IoU) по срезам
+    """
+    files = list(files)
+    ious = []
+    for start in range(0, len(files), batch_size):
+        batch = [prepare_model_input(file) for file in files[start:start + batch_size]]
+        images = [rgb for _, _, rgb in batch]
+        torch_detections = predict_detections(images, "torch")
+        onnx_detections = predict_detections(images, "onnx")
+        for (_, original_pixels, _), torch_result, onnx_result in zip(batch, torch_detections, onnx_detections):
+            ious.append(mask_iou(combine_masks(torch_result.masks, original_pixels.shape),
+                                 combine_masks(onnx_result.masks, original_pixels.shape)))
+
+    mean_iou = float(np.mean(ious)) if ious else 1.0
+    min_iou = min(ious, default=1.0)
+    print(f'ONNX vs ultralytics на {len(files)} срезах: средний IoU {round(mean_iou, 4)}, минимальный {round(min_iou, 4)}')
+    return mean_iou, min_iou
+
+
+def benchmark_mask_fusion(instances=3, repeats=50, size=MODEL_INPUT_SIZE):
+    """
+    Микро-бенчмарк объединения масок: прежний цикл ImageChops.lighter против fuse_masks.
+    :return: (мс на срез для PIL, мс на срез для NumPy)
+    """
+    rng = np.random.default_rng(0)
+    instance_masks = rng.random((instances, size[1], size[0])) > 0.7
+
+    def fuse_with_pil(masks):
+        combined_mask = Image.new("L", size, 0)
+        for mask in masks:
+            combined_mask = ImageChops.lighter(combined_mask, Image.fromarray(mask.astype(np.uint8) * 255))
+        return np.array(combined_mask) > 0
+
+    assert np.array_equal(fuse_with_pil(instance_masks), fuse_masks(instance_masks))
+
+    timings = []
+    for fuse in (fuse_with_pil, fuse_masks):
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            fuse(instance_masks)
+        timings.append((time.perf_counter() - start_time) / repeats * 1000)
+
+    print(f'Объединение {instances} масок: ImageChops {round(timings[0], 3)} мс, '
+          f'NumPy {round(timings[1], 3)} мс (x{round(timings[0] / timings[1], 1)})')
+    return tuple(timings)
+
+
 if __name__ == "__main__":
-    dicom_files = find_dicom_files('DICOM_DATASET')
-    processed_ = [process_dicom(dicom) for dicom in dicom_files]
-    # show_masks_grid(processed_)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сегментация печени на серии DICOM")
+    parser.add_argument("folder", nargs="?", default="DICOM_DATASET", help="папка с DICOM-серией")
+    parser.add_argument("-o", "--output", default="DICOM_MASKED", help="папка для masked_*.dcm")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="число процессов пула")
+    parser.add_argument("-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dicom2img", action="store_true", help="готовить вход модели через dicom2img")
+    parser.add_argument("--cache", help="папка дискового кэша масок (по умолчанию кэш выключен)")
+    parser.add_argument("--cache-size", type=int, default=512, help="предельный размер кэша масок, МБ")
+    parser.add_argument("--output-mode", choices=("masked", "labelmap", "both"), default="masked",
+                        help="masked — копии срезов masked_*.dcm, labelmap — один компактный объём меток "
+                             "liver_labels.npy/.json, both — оба варианта")
+    parser.add_argument("--force", action="store_true",
+                        help="обработать все срезы заново, не глядя на манифест прошлого прогона")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help="бэкенд инференса")
+    parser.add_argument("--parity", nargs="?", const="dicom2img", choices=("dicom2img", "onnx"),
+                        help="сравнить препроцессинг с dicom2img или маски ONNX с ultralytics")
+    parser.add_argument("--benchmark-fusion", action="store_true", help="микро-бенчмарк объединения масок")
+    parser.add_argument("--warmup", action="store_true", help="загрузить и прогреть модель до начала замера")
+    args = parser.parse_args()
+
+    if args.warmup:
+        get_model(warmup=True, backend=args.backend)
+
+    if args.benchmark_fusion:
+        benchmark_mask_fusion()
+    elif args.parity == "dicom2img":
+        check_preprocessing_parity(list_dicom_files(args.folder))
+    elif args.parity == "onnx":
+        check_backend_parity(list_dicom_files(args.folder))
+    else:
+        mask_cache = MaskCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+        if args.output_mode == "masked":
+            manifest = SegmentationManifest.for_output_dir(args.output)
+            if args.force:
+                manifest.entries.clear()
+        else:
+            # Карта меток собирается из масок всех срезов, поэтому пропускать срезы по манифесту нельзя
+            manifest = None
+        processed_ = segment_series(args.folder, args.output, workers=args.workers, batch_size=args.batch_size,
+                                    use_dicom2img=args.dicom2img, backend=args.backend, cache=mask_cache,
+                                    manifest=manifest, write_masked=args.output_mode != "labelmap")
+        if manifest is not None:
+            print(f'Манифест: {manifest.summary()}')
+        else:
+            write_series_label_map(list_dicom_files(args.folder), processed_, args.output)
+        # show_masks_grid(processed_)
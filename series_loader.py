@@ -0,0 +1,106 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from utils.dicom_series import ReadCancelled, read_series
+from utils.label_map import has_label_map, masked_volume_from_labels, read_label_map
+from utils.slice_index import SliceIndex
+from utils.summed_volume import SummedVolumeTable
+from utils.vtk_volume import liver_mask_to_vtk, volume_to_vtk, vtk_volume_array
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+def liver_data_from_label_map(body_data, folder):
+    """
+    Строит редактируемый объём печени из liver_labels.npy/.json и уже загруженного body_data.
+    :return: (vtkImageData, значение фона)
+    """
+    labels, geometry = read_label_map(folder)
+    dims = body_data.GetDimensions()
+    if tuple(geometry["dims"]) != tuple(dims):
+        raise ValueError(f"Размеры карты меток {geometry['dims']} не совпадают с серией {dims}")
+
+    body = vtk_volume_array(body_data)
+    liver = masked_volume_from_labels(body, labels, geometry["background_value"])
+    return volume_to_vtk(liver, {
+        "dims": list(dims), "spacing": list(body_data.GetSpacing()), "origin": list(body_data.GetOrigin()),
+    }), geometry["background_value"]
+
+
+class SeriesLoader(QThread):
+    """
+    Загружает исходную серию и серию печени в фоновом потоке, чтобы окно не зависало.
+
+    Сигналы приходят в GUI-поток: body_loaded — сразу, как готов исходный объём
+    (можно рендерить, не дожидаясь маски), liver_loaded(liver_data, mask_data, background_value) —
+    когда готов объём печени и его маска liver_mask (uint8 0/1).
+    progress(name, done, total) сообщает число прочитанных срезов.
+    liver_index_ready(table, slices) — таблица накопленных сумм и посрезовый индекс маски
+    печени; строятся уже после liver_loaded, чтобы не задерживать показ.
+    """
+    progress = pyqtSignal(str, int, int)
+    body_loaded = pyqtSignal(object)
+    liver_loaded = pyqtSignal(object, object, float)
+    liver_index_ready = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, body_folder, liver_folder, parent=None, volume_cache=None):
+        super().__init__(parent)
+        self.body_folder = body_folder
+        self.liver_folder = liver_folder
+        self.volume_cache = volume_cache
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def _check_cancelled(self):
+        if self._cancelled:
+            raise LoadCancelled()
+
+    def _read_series(self, folder, name):
+        """
+        :return: (vtkImageData, геометрия read_series)
+        """
+        cached = self.volume_cache.load(folder) if self.volume_cache is not None else None
+        if cached is not None:
+            volume, geometry = cached
+            self.progress.emit(name, len(geometry["sources"]), len(geometry["sources"]))
+            return volume_to_vtk(volume, geometry), geometry
+
+        try:
+            volume, geometry = read_series(folder, progress=lambda done, total: self.progress.emit(name, done, total),
+                                           is_cancelled=self.is_cancelled)
+        except ReadCancelled:
+            raise LoadCancelled()
+        if self.volume_cache is not None:
+            self.volume_cache.store(folder, volume, geometry)
+        return volume_to_vtk(volume, geometry), geometry
+
+    def run(self):
+        try:
+            body_data, _ = self._read_series(self.body_folder, "body")
+            self.body_loaded.emit(body_data)
+
+            if has_label_map(self.liver_folder):
+                liver_data, background_value = liver_data_from_label_map(body_data, self.liver_folder)
+            else:
+                liver_data, geometry = self._read_series(self.liver_folder, "liver")
+                background_value = geometry["background_value"]
+            mask_data = liver_mask_to_vtk(liver_data, background_value)
+            self._check_cancelled()
+            self.liver_loaded.emit(liver_data, mask_data, background_value)
+
+            mask = vtk_volume_array(mask_data).view(bool)
+            table = SummedVolumeTable(mask)
+            slices = SliceIndex(mask, liver_data.GetSpacing())
+            self._check_cancelled()
+            self.liver_index_ready.emit(table, slices)
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,103 @@
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+
+class SliceAnimator(QObject):
+    """
+    Планировщик анимации плоскости среза.
+
+    Таймер однократный и взводится заново только после того, как кадр отрисован,
+    поэтому тики не копятся в очереди во время долгого рендера — лишние просто не
+    возникают. Пауза между кадрами подстраивается под измеренное время рендера так,
+    чтобы анимация занимала не больше cpu_share времени GUI-потока. Пока идёт
+    взаимодействие (is_busy), тики пропускаются без сдвига плоскости.
+
+    position_changed(z) приходит, когда плоскость нужно перерисовать в позиции z.
+    """
+    position_changed = pyqtSignal(float)
+
+    def __init__(self, frame_counter, parent=None, min_interval_ms=20, cpu_share=0.5, steps=500, is_busy=None):
+        """
+        :param frame_counter: FrameTimeCounter окна, по нему оценивается время кадра
+        :param steps: число шагов на проход от zmin до zmax
+        :param is_busy: callable() -> bool, True — пропустить тик (например, пока пользователь вращает камеру)
+        """
+        super().__init__(parent)
+        self.frame_counter = frame_counter
+        self.min_interval_ms = min_interval_ms
+        self.cpu_share = cpu_share
+        self.steps = steps
+        self.is_busy = is_busy
+        self.z_min = self.z_max = self.z = 0.0
+        self.direction = 1  # 1 – движение вверх, -1 – вниз
+        self.running = False
+        self.dropped_ticks = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._tick)
+
+    def configure(self, z_min, z_max):
+        self.z_min, self.z_max = z_min, z_max
+        self.z = min(max(self.z, z_min), z_max)
+
+    @property
+    def step_size(self):
+        return (self.z_max - self.z_min) / self.steps
+
+    def interval_ms(self):
+        """
+        Пауза до следующего кадра: при времени кадра r и доле cpu_share = s
+        простой между кадрами r * (1 - s) / s.
+        """
+        frame_ms = self.frame_counter.average_ms()
+        return int(max(self.min_interval_ms, frame_ms * (1.0 - self.cpu_share) / self.cpu_share))
+
+    def start(self):
+        self.running = True
+        self._schedule()
+
+    def pause(self):
+        self.running = False
+        self.timer.stop()
+
+    def toggle(self):
+        if self.running:
+            self.pause()
+        else:
+            self.start()
+
+    def step(self, count=1):
+        """
+        Сдвигает плоскость на count шагов (отрицательное — вниз) в пределах [z_min, z_max].
+        """
+        self.seek(self.z + count * self.step_size)
+
+    def advance(self):
+        """
+        Шаг анимации в текущем направлении с отражением от границ.
+        """
+        z = self.z + self.step_size * self.direction
+        if z >= self.z_max:
+            z = self.z_max
+            self.direction = -1
+        elif z <= self.z_min:
+            z = self.z_min
+            self.direction = 1
+        self.seek(z)
+
+    def seek(self, z):
+        self.z = min(max(z, self.z_min), self.z_max)
+        self.position_changed.emit(self.z)
+
+    def _schedule(self):
+        if self.running:
+            self.timer.start(self.interval_ms())
+
+    def _tick(self):
+        if not self.running:
+            return
+        if self.is_busy is not None and self.is_busy():
+            self.dropped_ticks += 1
+        else:
+            self.advance()
+        self._schedule()
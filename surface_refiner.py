@@ -0,0 +1,24 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from utils.iso_surface import refine_mesh
+
+
+class SurfaceRefiner(QThread):
+    """
+    Сглаживает и прореживает изоповерхность в фоновом потоке
+    (фильтры VTK отпускают GIL, окно остаётся отзывчивым).
+    refined(key, mesh) приходит в GUI-поток с ключом кэша уточнённой сетки.
+    """
+    refined = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, key, mesh, parent=None):
+        super().__init__(parent)
+        self.key = key
+        self.mesh = mesh
+
+    def run(self):
+        try:
+            self.refined.emit(self.key, refine_mesh(self.mesh))
+        except Exception as e:
+            self.failed.emit(str(e))
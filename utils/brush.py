@@ -0,0 +1,101 @@
+from functools import lru_cache
+
+import numpy as np
+
+BRUSH_MODES = ("add", "remove")
+
+
+@lru_cache(maxsize=16)
+def spherical_kernel(radius):
+    """
+    Булева сфера радиуса radius (в вокселях) в кубе (2r+1)^3, порядок осей (z, y, x).
+    Кэшируется по радиусу; массив только для чтения.
+    """
+    offsets = np.arange(-radius, radius + 1) ** 2
+    kernel = offsets[:, None, None] + offsets[None, :, None] + offsets[None, None, :] <= radius ** 2
+    kernel.setflags(write=False)
+    return kernel
+
+
+class Brush:
+    """
+    Сферическая кисть над маской печени (z, y, x): мазок — одна векторная операция
+    над подкубом вместо обхода вокселей через GetTuple1/SetTuple1.
+
+    add включает воксели в маску, remove исключает. Редактируемый объём меняется
+    вместе с маской, как в masked_volume_from_labels: добавленные воксели получают
+    значения исходной КТ, удалённые — фон серии. Так подсчёт объёма и изоповерхность
+    (по маске) совпадают с тем, что показывает объёмный рендеринг (по объёму).
+    """
+
+    def __init__(self, mask, volume, source, background_value, radius=10):
+        """
+        :param mask: изменяемая булева маска (z, y, x), общая с маской в VTK
+        :param volume: изменяемый объём печени (z, y, x), общий с vtkImageData
+        :param source: исходная КТ той же формы — значения для добавленных вокселей
+        :param background_value: значение фона маскированной серии
+        """
+        if not (mask.shape == volume.shape == source.shape):
+            raise ValueError(f"Размеры маски {mask.shape}, объёма {volume.shape} и КТ {source.shape} не совпадают")
+        self.mask = mask
+        self.volume = volume
+        self.source = source
+        self.background_value = np.asarray(background_value).astype(volume.dtype)
+        self.radius = radius
+
+    def stroke(self, i, j, k, mode="add"):
+        """
+        Мазок с центром в вокселе (i, j, k) = (x, y, z).
+        :param mode: add — добавить воксели к печени, remove — убрать
+        :return: затронутый экстент (i0, i1, j0, j1, k0, k1) включительно или None, если центр вне объёма
+        """
+        if mode not in BRUSH_MODES:
+            raise ValueError(f"Неизвестный режим кисти: {mode}, ожидается один из {BRUSH_MODES}")
+        depth, rows, columns = self.mask.shape
+        if not (0 <= i < columns and 0 <= j < rows and 0 <= k < depth):
+            return None
+
+        r = self.radius
+        lower = [max(center - r, 0) for center in (k, j, i)]
+        upper = [min(center + r + 1, size) for center, size in zip((k, j, i), (depth, rows, columns))]
+        region = tuple(slice(lo, hi) for lo, hi in zip(lower, upper))
+        # Обрезаем ядро так же, как подкуб у границ объёма
+        kernel = spherical_kernel(r)[tuple(slice(lo - (center - r), hi - (center - r))
+                                           for lo, hi, center in zip(lower, upper, (k, j, i)))]
+
+        self.mask[region][kernel] = mode == "add"
+        block = self.volume[region]
+        block[kernel] = self.source[region][kernel] if mode == "add" else self.background_value
+
+        (k0, k1), (j0, j1), (i0, i1) = ((lo, hi - 1) for lo, hi in zip(lower, upper))
+        return i0, i1, j0, j1, k0, k1
+
+
+def stroke_path(start, end, step):
+    """
+    Центры штампов на отрезке от start (не включая) до end (включая) с шагом не больше step вокселей,
+    чтобы быстрое движение мыши не оставляло разрывов в мазке.
+    :param start: воксель (i, j, k) предыдущего штампа или None для первого
+    """
+    if start is None:
+        return [tuple(end)]
+    if tuple(start) == tuple(end):
+        # Мышь не ушла из вокселя — повторный штамп накапливал бы интенсивность на месте
+        return []
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    count = max(int(np.ceil(np.linalg.norm(end - start) / step)), 1)
+    fractions = np.arange(1, count + 1)[:, None] / count
+    centers = np.rint(start + (end - start) * fractions).astype(int)
+    return [tuple(int(value) for value in center) for center in centers]
+
+
+def merge_extents(first, second):
+    """
+    Объединение экстентов (i0, i1, j0, j1, k0, k1); None — пустой экстент.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return tuple(min(a, b) if index % 2 == 0 else max(a, b) for index, (a, b) in enumerate(zip(first, second)))
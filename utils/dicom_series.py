@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pydicom
+from pydicom.dataelem import RawDataElement
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian
+
+
+def read_headers(files):
+    """
+    Читает только заголовки срезов, без пиксельных данных.
+    """
+    return [pydicom.dcmread(file, stop_before_pixels=True) for file in files]
+
+
+def slice_position(ds):
+    """
+    Положение среза вдоль нормали к плоскости среза (или InstanceNumber, если позиции нет).
+    """
+    try:
+        orientation = np.array(ds.ImageOrientationPatient, dtype=np.float64)
+        normal = np.cross(orientation[:3], orientation[3:])
+        return float(np.dot(normal, np.array(ds.ImagePositionPatient, dtype=np.float64)))
+    except AttributeError:
+        return -float(ds.InstanceNumber)
+
+
+def sort_series(files, headers):
+    """
+    Упорядочивает срезы так же, как vtkDICOMImageReader: от наибольшей позиции
+    вдоль нормали к наименьшей (первым идёт первый срез серии).
+    :return: (отсортированные файлы, отсортированные заголовки)
+    """
+    order = sorted(range(len(files)), key=lambda index: slice_position(headers[index]), reverse=True)
+    return [files[index] for index in order], [headers[index] for index in order]
+
+
+def series_geometry(headers):
+    """
+    Геометрия отсортированной серии в терминах vtkImageData.
+    Строки срезов при загрузке переворачиваются (как в vtkDICOMImageReader), поэтому
+    origin — (0, 0, 0), а шаг по z — расстояние между соседними срезами.
+    :return: dict с dims (x, y, z), spacing, origin
+    """
+    first = headers[0]
+    row_spacing, column_spacing = (float(value) for value in first.PixelSpacing)
+    if len(headers) > 1:
+        slice_spacing = abs(slice_position(headers[0]) - slice_position(headers[1]))
+    else:
+        slice_spacing = float(first.get("SliceThickness", 1.0))
+    return {
+        "dims": [int(first.Columns), int(first.Rows), len(headers)],
+        "spacing": [column_spacing, row_spacing, slice_spacing],
+        "origin": [0.0, 0.0, 0.0],
+    }
+
+
+def list_dicom_files(folder):
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.lower().endswith(".dcm")]
+
+
+class ReadCancelled(Exception):
+    pass
+
+
+def read_headers_deferred(file):
+    """
+    Читает заголовок среза, не загружая PixelData: pydicom запоминает только
+    смещение и длину пиксельных данных в файле.
+    """
+    return pydicom.dcmread(file, defer_size=1024)
+
+
+def raw_pixel_layout(ds):
+    """
+    Смещение, dtype и форма несжатых пиксельных данных, если их можно прочитать
+    напрямую из файла (один кадр, little endian, один канал); иначе None.
+    """
+    if ds.file_meta.TransferSyntaxUID not in (ExplicitVRLittleEndian, ImplicitVRLittleEndian):
+        return None
+    if int(ds.get("SamplesPerPixel", 1)) != 1 or int(ds.get("NumberOfFrames") or 1) != 1:
+        return None
+    if int(ds.BitsAllocated) not in (8, 16):
+        return None
+    element = ds.get_item("PixelData", keep_deferred=True)
+    if not isinstance(element, RawDataElement) or element.value is not None:
+        return None
+    kind = "i" if int(ds.PixelRepresentation) == 1 else "u"
+    dtype = np.dtype(f"<{kind}{int(ds.BitsAllocated) // 8}")
+    return element.value_tell, dtype, (int(ds.Rows), int(ds.Columns))
+
+
+def decode_slice(file, ds):
+    """
+    Пиксели среза: несжатые данные читаются напрямую по смещению из заголовка,
+    остальные — через pydicom.
+    """
+    layout = raw_pixel_layout(ds)
+    if layout is None:
+        return pydicom.dcmread(file).pixel_array
+    offset, dtype, shape = layout
+    return np.fromfile(file, dtype=dtype, count=shape[0] * shape[1], offset=offset).reshape(shape)
+
+
+def read_series(folder, workers=None, progress=None, is_cancelled=None):
+    """
+    Читает серию в один int16-объём (z, y, x) в порядке и ориентации vtkDICOMImageReader
+    (значения в единицах после rescale slope/intercept, строки снизу вверх).
+
+    Сначала один проход по заголовкам (PixelData не читается) для сортировки срезов,
+    затем пиксели декодируются пулом потоков прямо в заранее выделенный массив.
+    :param progress: callable(done, total), вызывается после каждого среза
+    :param is_cancelled: callable() -> bool; при True чтение прерывается ReadCancelled
+    :return: (volume, geometry)
+    """
+    files = list_dicom_files(folder)
+    if not files:
+        raise FileNotFoundError(f"В папке {folder} нет DICOM-файлов")
+    files, headers = sort_series(files, [read_headers_deferred(file) for file in files])
+    geometry = series_geometry(headers)
+    columns, rows, slices = geometry["dims"]
+    volume = np.empty((slices, rows, columns), dtype=np.int16)
+
+    def decode(index):
+        if is_cancelled is not None and is_cancelled():
+            raise ReadCancelled()
+        ds = headers[index]
+        pixels = decode_slice(files[index], ds)[::-1]
+        slope = float(ds.get("RescaleSlope", 1.0))
+        intercept = float(ds.get("RescaleIntercept", 0.0))
+        if slope == 1.0 and intercept.is_integer():
+            np.add(pixels, np.int32(intercept), out=volume[index], casting="unsafe")
+        else:
+            np.copyto(volume[index], np.rint(pixels * slope + intercept), casting="unsafe")
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(decode, index) for index in range(slices)]
+        try:
+            for future in futures:
+                future.result()
+                done += 1
+                if progress is not None:
+                    progress(done, slices)
+        except ReadCancelled:
+            for future in futures:
+                future.cancel()
+            raise
+
+    geometry["sources"] = [os.path.basename(file) for file in files]
+    # Сырой 0 после rescale (округлённый, как в объёме) — фон маскированных серий
+    geometry["background_value"] = float(np.rint(float(headers[0].get("RescaleIntercept", 0.0))))
+    return volume, geometry
@@ -0,0 +1,40 @@
+import time
+from collections import deque
+
+
+class FrameTimeCounter:
+    """
+    Время кадров окна VTK по событиям StartEvent/EndEvent: учитываются все рендеры,
+    в том числе вызванные интерактором (вращение камеры, box-виджет).
+    """
+
+    def __init__(self, window=60):
+        self.times = deque(maxlen=window)
+        self.frames = 0
+        self._start = None
+
+    def attach(self, render_window):
+        render_window.AddObserver("StartEvent", self._on_start)
+        render_window.AddObserver("EndEvent", self._on_end)
+
+    def _on_start(self, caller, event):
+        self._start = time.perf_counter()
+
+    def _on_end(self, caller, event):
+        if self._start is not None:
+            self.times.append(time.perf_counter() - self._start)
+            self.frames += 1
+            self._start = None
+
+    def last_ms(self):
+        return self.times[-1] * 1000 if self.times else 0.0
+
+    def average_ms(self):
+        return sum(self.times) / len(self.times) * 1000 if self.times else 0.0
+
+    def max_ms(self):
+        return max(self.times) * 1000 if self.times else 0.0
+
+    def summary(self):
+        return (f"Кадр: {round(self.last_ms(), 1)} мс (ср. {round(self.average_ms(), 1)}, "
+                f"макс. {round(self.max_ms(), 1)} за {len(self.times)})")
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+
+import vtk
+
+# Изоповерхность печени строится по 0/1-маске (liver_mask или карта меток) — посередине
+LIVER_ISO_VALUE = 0.5
+# Во время перетаскивания слайдера поверхность строится по уменьшенному объёму
+COARSE_SHRINK_FACTORS = (4, 4, 1)
+
+
+def extract_iso_surface(image, iso_value, coarse=False):
+    """
+    Изоповерхность vtkFlyingEdges3D (многопоточный, быстрее vtkMarchingCubes).
+    :param coarse: строить по объёму, уменьшенному в COARSE_SHRINK_FACTORS раз
+    :return: vtkPolyData с нормалями
+    """
+    source = image
+    if coarse:
+        shrink = vtk.vtkImageShrink3D()
+        shrink.SetInputData(image)
+        shrink.SetShrinkFactors(*COARSE_SHRINK_FACTORS)
+        shrink.AveragingOn()
+        shrink.Update()
+        source = shrink.GetOutput()
+
+    flying_edges = vtk.vtkFlyingEdges3D()
+    flying_edges.SetInputData(source)
+    flying_edges.SetValue(0, iso_value)
+    flying_edges.ComputeNormalsOn()
+    flying_edges.ComputeScalarsOff()
+    flying_edges.Update()
+
+    mesh = vtk.vtkPolyData()
+    mesh.ShallowCopy(flying_edges.GetOutput())
+    return mesh
+
+
+def refine_mesh(mesh, smoothing_iterations=15, divisions=(256, 256, 128)):
+    """
+    Сглаживание (windowed sinc) и прореживание (quadric clustering) поверхности.
+    vtkQuadricDecimation на сетках из FlyingEdges почти не сокращает число треугольников,
+    поэтому используется кластеризация вершин по сетке divisions.
+    """
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputData(mesh)
+    smoother.SetNumberOfIterations(smoothing_iterations)
+    smoother.NormalizeCoordinatesOn()
+
+    decimate = vtk.vtkQuadricClustering()
+    decimate.SetInputConnection(smoother.GetOutputPort())
+    decimate.AutoAdjustNumberOfDivisionsOff()
+    decimate.SetNumberOfDivisions(*divisions)
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(decimate.GetOutputPort())
+    normals.SplittingOff()
+    normals.Update()
+
+    refined = vtk.vtkPolyData()
+    refined.ShallowCopy(normals.GetOutput())
+    return refined
+
+
+def surface_key(image, iso_value, level):
+    """
+    Ключ кэша: объём и его MTime (правки кистью дают новый ключ), порог, уровень детализации.
+    """
+    return id(image), image.GetMTime(), iso_value, level
+
+
+class MeshCache:
+    """
+    LRU-кэш изоповерхностей в памяти, ограниченный суммарным размером сеток.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._meshes = OrderedDict()
+        self._total_bytes = 0
+
+    def get(self, key):
+        mesh = self._meshes.get(key)
+        if mesh is not None:
+            self._meshes.move_to_end(key)
+        return mesh
+
+    def put(self, key, mesh):
+        if key in self._meshes:
+            self._total_bytes -= self._meshes.pop(key).GetActualMemorySize() * 1024
+        self._meshes[key] = mesh
+        self._total_bytes += mesh.GetActualMemorySize() * 1024
+        while self._total_bytes > self.max_bytes and len(self._meshes) > 1:
+            _, evicted = self._meshes.popitem(last=False)
+            self._total_bytes -= evicted.GetActualMemorySize() * 1024
+
+    def clear(self):
+        self._meshes.clear()
+        self._total_bytes = 0
+
+    def __len__(self):
+        return len(self._meshes)
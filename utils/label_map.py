@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+
+from utils.dicom_series import read_headers, series_geometry, sort_series
+
+LABEL_MAP_NAME = "liver_labels"
+LABEL_BACKGROUND = 0
+LABEL_LIVER = 1
+LABEL_LESION = 2
+LABEL_VESSEL = 3
+# Имена меток в сайдкаре .json; карта может содержать только часть из них
+LABEL_NAMES = {"background": LABEL_BACKGROUND, "liver": LABEL_LIVER, "lesion": LABEL_LESION, "vessel": LABEL_VESSEL}
+
+
+def label_map_paths(directory):
+    """
+    :return: (путь к .npy с метками, путь к .json с геометрией)
+    """
+    base = os.path.join(directory, LABEL_MAP_NAME)
+    return f"{base}.npy", f"{base}.json"
+
+
+def has_label_map(directory):
+    return all(os.path.exists(path) for path in label_map_paths(directory))
+
+
+def write_label_map(directory, labels, geometry, packed=None, label_names=None):
+    """
+    Сохраняет объём меток (z, y, x) одним .npy и геометрию в .json рядом.
+    :param labels: uint8 метки в порядке осей vtkImageData (z, y, x), строки снизу вверх
+    :param geometry: dims/spacing/origin и прочие поля для сайдкара
+    :param packed: упаковать биты (8 вокселей в байт); по умолчанию — если метки только 0/1
+    :param label_names: {имя: значение} для сайдкара, по умолчанию LABEL_NAMES
+    :return: путь к .npy
+    """
+    labels = np.ascontiguousarray(labels, dtype=np.uint8)
+    if packed is None:
+        packed = labels.max(initial=0) <= LABEL_LIVER
+    npy_path, json_path = label_map_paths(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    data = np.packbits(labels.ravel()) if packed else labels
+    tmp_path = f"{npy_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp_path, npy_path)
+
+    sidecar = dict(geometry)
+    sidecar.update({
+        "shape": list(labels.shape),
+        "encoding": "packbits" if packed else "uint8",
+        "labels": dict(label_names or LABEL_NAMES),
+    })
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False, indent=1)
+    return npy_path
+
+
+def read_label_map(directory):
+    """
+    :return: (uint8 метки (z, y, x), словарь геометрии из сайдкара)
+    """
+    npy_path, json_path = label_map_paths(directory)
+    with open(json_path, encoding="utf-8") as f:
+        geometry = json.load(f)
+    shape = tuple(geometry["shape"])
+    if geometry["encoding"] == "packbits":
+        labels = np.unpackbits(np.load(npy_path), count=int(np.prod(shape))).reshape(shape)
+    else:
+        # uint8-метки открываем через memmap: страницы подгружаются по мере обращения
+        labels = np.load(npy_path, mmap_mode="r")
+    return labels, geometry
+
+
+def write_series_label_map(files, masks, directory):
+    """
+    Собирает маски срезов серии в один объём меток в порядке и ориентации
+    vtkDICOMImageReader и сохраняет его вместе с геометрией.
+    :param files: исходные файлы серии
+    :param masks: булевы маски срезов (rows, columns) в порядке files
+    """
+    headers = read_headers(files)
+    mask_by_file = dict(zip(files, masks))
+    sorted_files, sorted_headers = sort_series(list(files), headers)
+
+    labels = np.stack([mask_by_file[file] for file in sorted_files]).astype(np.uint8) * LABEL_LIVER
+    # Строки снизу вверх, как в vtkImageData после vtkDICOMImageReader
+    labels = labels[:, ::-1, :]
+
+    geometry = series_geometry(sorted_headers)
+    geometry["sources"] = [os.path.basename(file) for file in sorted_files]
+    # Значение, которое фон принимает в masked_*.dcm после rescale (сырые пиксели = 0)
+    geometry["background_value"] = float(sorted_headers[0].get("RescaleIntercept", 0.0))
+
+    path = write_label_map(directory, labels, geometry)
+    print(f'Карта меток сохранена: {path} ({round(os.path.getsize(path) / 1024 / 1024, 2)} МБ)')
+    return path
+
+
+def liver_mask(volume, background_value):
+    """
+    Печень в маскированной КТ (masked_*.dcm или masked_volume_from_labels): все воксели,
+    кроме фона — значения, которое после rescale принимают обнулённые пиксели (RescaleIntercept).
+    Единое определение для подсчёта объёма в окне и CLI, изоповерхности и экспорта сетки.
+    Именно неравенство, а не порог: в знаковой КТ ткань внутри маски бывает ниже фона.
+    :return: булева маска той же формы
+    """
+    return volume != np.asarray(background_value).astype(volume.dtype)
+
+
+def masked_volume_from_labels(body, labels, background_value):
+    """
+    Восстанавливает «маскированную» копию КТ (как из masked_*.dcm) из исходного
+    объёма и карты меток — без чтения второй серии с диска.
+    """
+    return np.where(labels.reshape(body.shape) != LABEL_BACKGROUND, body,
+                    np.asarray(background_value).astype(body.dtype))
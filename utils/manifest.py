@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+
+MANIFEST_NAME = "manifest.json"
+PARTIAL_DIR = ".partial"
+
+
+def atomic_save_dataset(ds, out_path):
+    """
+    Сохраняет DICOM через временный файл в подпапке .partial и os.replace,
+    чтобы после сбоя в папке серии не оставалось недописанных срезов
+    (vtkDICOMImageReader читает все файлы папки, но не заходит в подпапки).
+    """
+    partial_dir = os.path.join(os.path.dirname(out_path), PARTIAL_DIR)
+    os.makedirs(partial_dir, exist_ok=True)
+    tmp_path = os.path.join(partial_dir, f"{os.path.basename(out_path)}.{threading.get_ident()}.tmp")
+    ds.save_as(tmp_path)
+    os.replace(tmp_path, out_path)
+
+
+class SegmentationManifest:
+    """
+    Журнал прогона сегментации в папке результатов: для каждого исходного среза
+    хранит путь, mtime и размер источника, версию модели, выходной файл и статус.
+    Повторный прогон обрабатывает только новые, изменённые или упавшие срезы.
+    """
+
+    def __init__(self, path, save_interval=1.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        # Недописанные файлы прошлого прогона больше не нужны
+        partial_dir = os.path.join(output_dir, PARTIAL_DIR)
+        if os.path.isdir(partial_dir):
+            for name in os.listdir(partial_dir):
+                os.remove(os.path.join(partial_dir, name))
+        return cls(os.path.join(output_dir, MANIFEST_NAME))
+
+    @staticmethod
+    def _key(file):
+        return os.path.abspath(file)
+
+    def needs_processing(self, file, model_version):
+        entry = self.entries.get(self._key(file))
+        if entry is None or entry["status"] != "done":
+            return True
+        stat = os.stat(file)
+        return (entry["source_mtime"] != stat.st_mtime_ns
+                or entry["source_size"] != stat.st_size
+                or entry["model_version"] != model_version
+                or not os.path.exists(entry["output"]))
+
+    def filter_pending(self, files, model_version):
+        """
+        :return: срезы, которые нужно (пере)обработать, в исходном порядке
+        """
+        return [file for file in files if self.needs_processing(file, model_version)]
+
+    def _record(self, file, output, model_version, status, error=None):
+        try:
+            stat = os.stat(file)
+        except OSError:
+            # Источник мог исчезнуть во время прогона: запись всё равно нужна,
+            # а исключение здесь остановило бы поток writer'а
+            stat = None
+        entry = {
+            "source": os.path.abspath(file),
+            "source_mtime": stat.st_mtime_ns if stat is not None else None,
+            "source_size": stat.st_size if stat is not None else None,
+            "model_version": model_version,
+            "output": os.path.abspath(output) if output else None,
+            "status": status,
+        }
+        if error is not None:
+            entry["error"] = str(error)
+        with self._lock:
+            self.entries[self._key(file)] = entry
+            if time.time() - self._last_save >= self.save_interval:
+                self._save()
+
+    def mark_done(self, file, output, model_version):
+        self._record(file, output, model_version, "done")
+
+    def mark_failed(self, file, model_version, error):
+        self._record(file, None, model_version, "failed", error)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.time()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def summary(self):
+        statuses = [entry["status"] for entry in self.entries.values()]
+        return {status: statuses.count(status) for status in set(statuses)}
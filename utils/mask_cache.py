@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def file_fingerprint(path):
+    """
+    Дешёвый отпечаток файла (имя, размер, mtime) без чтения содержимого.
+    """
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class MaskCache:
+    """
+    Дисковый кэш масок сегментации: один сжатый .npz с упакованными битами на срез.
+
+    Ключ — SHA-256 от входа модели для среза, отпечатка весов модели и параметров препроцессинга,
+    поэтому смена любого из них даёт промах. Размер кэша ограничен max_bytes:
+    при переполнении удаляются давно не использованные записи (LRU по mtime файла).
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Текущие записи: путь -> (mtime для LRU, размер)
+        self._entries = {}
+        for name in os.listdir(cache_dir):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(cache_dir, name))
+                self._entries[os.path.join(cache_dir, name)] = (stat.st_mtime, stat.st_size)
+        self._total_bytes = sum(size for _, size in self._entries.values())
+
+    @staticmethod
+    def key(pixels, model_id, params):
+        """
+        :param pixels: пиксели, от которых зависит маска (вход модели)
+        :param model_id: отпечаток весов модели
+        :param params: параметры препроцессинга/бэкенда, влияющие на маску
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{pixels.shape}:{pixels.dtype}".encode())
+        digest.update(np.ascontiguousarray(pixels).tobytes())
+        digest.update(str(model_id).encode())
+        digest.update(repr(sorted(params.items())).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        :return: булева маска или None при промахе
+        """
+        path = self._path(key)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                # Отмечаем использование для LRU
+                os.utime(path)
+                self._entries[path] = (os.stat(path).st_mtime, self._entries[path][1])
+            except FileNotFoundError:
+                self._forget(path)
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        try:
+            with np.load(path) as data:
+                shape = tuple(data["shape"])
+                return np.unpackbits(data["bits"], count=int(np.prod(shape))).reshape(shape).astype(bool)
+        except FileNotFoundError:
+            # Файл успел вытеснить put() из потока writer'а — считаем промахом
+            with self._lock:
+                self._forget(path)
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, key, mask):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, bits=np.packbits(mask), shape=np.array(mask.shape))
+        os.replace(tmp_path, path)
+
+        stat = os.stat(path)
+        with self._lock:
+            if path in self._entries:
+                self._total_bytes -= self._entries[path][1]
+            self._entries[path] = (stat.st_mtime, stat.st_size)
+            self._total_bytes += stat.st_size
+            self._evict()
+
+    def _forget(self, path):
+        if path in self._entries:
+            self._total_bytes -= self._entries.pop(path)[1]
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for path, (_, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            del self._entries[path]
+            self._total_bytes -= size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f'Кэш масок: {stats["hits"]} попаданий, {stats["misses"]} промахов '
+              f'({round(stats["hit_rate"] * 100, 1)}%), {stats["entries"]} записей, '
+              f'{round(stats["bytes"] / 1024 / 1024, 2)} МБ')
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def fit_crop_box(image_size, size, centering=(0.5, 0.5)):
+    """
+    Область исходного изображения, которую ImageOps.fit растягивает до size.
+    :param image_size: (width, height) исходного изображения
+    :param size: (width, height) результата
+    :return: (left, top, right, bottom) во float-координатах, как у PIL
+    """
+    width, height = image_size
+    image_ratio = width / height
+    output_ratio = size[0] / size[1]
+    if image_ratio == output_ratio:
+        crop_width, crop_height = width, height
+    elif image_ratio >= output_ratio:
+        crop_width, crop_height = output_ratio * height, height
+    else:
+        crop_width, crop_height = width, width / output_ratio
+    left = (width - crop_width) * centering[0]
+    top = (height - crop_height) * centering[1]
+    return left, top, left + crop_width, top + crop_height
+
+
+class MaskResampler:
+    """
+    Nearest-neighbour перенос маски из пространства модели (после ImageOps.fit)
+    обратно на сетку исходного среза.
+
+    Индексные карты считаются один раз на геометрию серии; каждый вызов — это
+    одна выборка fancy-индексами в булев буфер без float-временных массивов.
+    Пиксели, обрезанные ImageOps.fit, модель не видела — они всегда False.
+    """
+
+    def __init__(self, original_shape, model_size=(640, 640), centering=(0.5, 0.5)):
+        self.original_shape = tuple(original_shape)
+        self.model_size = tuple(model_size)
+        height, width = self.original_shape
+        left, top, right, bottom = fit_crop_box((width, height), self.model_size, centering)
+
+        self.rows, self.row_index = self._index_map(height, top, bottom, self.model_size[1])
+        self.cols, self.col_index = self._index_map(width, left, right, self.model_size[0])
+
+    @staticmethod
+    def _index_map(length, start, stop, model_length):
+        # Центр пикселя i исходника в координатах модели, затем ближайший пиксель модели
+        scale = model_length / (stop - start)
+        centers = (np.arange(length) + 0.5 - start) * scale - 0.5
+        index = np.floor(centers + 0.5).astype(np.intp)
+        inside = np.flatnonzero((index >= 0) & (index < model_length))
+        if inside.size == 0:
+            return slice(0, 0), index[:0]
+        start, stop = int(inside[0]), int(inside[-1]) + 1
+        return slice(start, stop), index[start:stop]
+
+    def __call__(self, mask, out=None):
+        """
+        :param mask: булева маска в пространстве модели (model_height, model_width)
+        :param out: булев буфер формы original_shape для повторного использования
+        :return: булева маска формы original_shape
+        """
+        if out is None:
+            out = np.zeros(self.original_shape, dtype=bool)
+        else:
+            out.fill(False)
+        out[self.rows, self.cols] = mask[self.row_index[:, None], self.col_index[None, :]]
+        return out
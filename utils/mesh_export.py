@@ -0,0 +1,120 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import vtk
+
+from utils.dicom_series import read_series
+from utils.iso_surface import LIVER_ISO_VALUE, extract_iso_surface
+from utils.label_map import has_label_map, liver_mask, read_label_map
+from utils.vtk_volume import volume_to_vtk
+
+MESH_FORMATS = (".stl", ".ply", ".obj")
+DEFAULT_TARGET_TRIANGLES = 200_000
+
+
+def decimate_to_triangles(mesh, target_triangles):
+    """
+    Прореживает сетку до target_triangles треугольников (vtkQuadricDecimation с сохранением объёма).
+    """
+    triangles = mesh.GetNumberOfPolys()
+    if not target_triangles or triangles <= target_triangles:
+        return mesh
+    decimate = vtk.vtkQuadricDecimation()
+    decimate.SetInputData(mesh)
+    decimate.SetTargetReduction(1.0 - target_triangles / triangles)
+    decimate.VolumePreservationOn()
+    decimate.Update()
+    return decimate.GetOutput()
+
+
+def smooth_mesh(mesh, iterations):
+    if not iterations:
+        return mesh
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputData(mesh)
+    smoother.SetNumberOfIterations(iterations)
+    smoother.NormalizeCoordinatesOn()
+    smoother.Update()
+    return smoother.GetOutput()
+
+
+def write_mesh(mesh, path):
+    """
+    Пишет сетку по расширению: STL и PLY — бинарные, OBJ — текстовый (бинарного OBJ нет).
+    Писатели VTK выводят треугольники в файл по мере обхода, без промежуточного буфера.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".stl":
+        writer = vtk.vtkSTLWriter()
+        writer.SetFileTypeToBinary()
+    elif extension == ".ply":
+        writer = vtk.vtkPLYWriter()
+        writer.SetFileTypeToBinary()
+    elif extension == ".obj":
+        writer = vtk.vtkOBJWriter()
+    else:
+        raise ValueError(f"Неподдерживаемый формат {extension}, ожидается один из {MESH_FORMATS}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer.SetFileName(path)
+    writer.SetInputData(mesh)
+    if not writer.Write():
+        raise OSError(f"Не удалось записать {path}")
+    return path
+
+
+def export_surface(image, iso_value, path, target_triangles=DEFAULT_TARGET_TRIANGLES, smoothing_iterations=15):
+    """
+    Изоповерхность (vtkFlyingEdges3D) → сглаживание → прореживание до target_triangles → файл.
+    Координаты — мм в системе vtkImageData, как в окне просмотра.
+    :return: число треугольников в записанной сетке
+    """
+    start_time = time.time()
+    mesh = extract_iso_surface(image, iso_value)
+    extracted = mesh.GetNumberOfPolys()
+    mesh = smooth_mesh(mesh, smoothing_iterations)
+    mesh = decimate_to_triangles(mesh, target_triangles)
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputData(mesh)
+    normals.SplittingOff()
+    normals.Update()
+    mesh = normals.GetOutput()
+
+    write_mesh(mesh, path)
+    triangles = mesh.GetNumberOfPolys()
+    print(f'Сетка печени сохранена: {path} ({extracted} -> {triangles} треугольников, '
+          f'{round(os.path.getsize(path) / 1024 / 1024, 2)} МБ, {round(time.time() - start_time, 2)}с)')
+    return triangles
+
+
+def liver_image_from_folder(folder):
+    """
+    Объём печени из папки: карта меток liver_labels, если есть, иначе маска liver_mask
+    маскированной DICOM-серии. Поверхность в обоих случаях — LIVER_ISO_VALUE.
+    :return: vtkImageData
+    """
+    if has_label_map(folder):
+        labels, geometry = read_label_map(folder)
+        return volume_to_vtk(labels, geometry)
+    volume, geometry = read_series(folder)
+    return volume_to_vtk(liver_mask(volume, geometry["background_value"]).view(np.uint8), geometry)
+
+
+def export_liver_mesh(folder, path, target_triangles=DEFAULT_TARGET_TRIANGLES, smoothing_iterations=15):
+    image = liver_image_from_folder(folder)
+    return export_surface(image, LIVER_ISO_VALUE, path, target_triangles, smoothing_iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт поверхности печени в STL/PLY/OBJ")
+    parser.add_argument("folder", help="папка с маскированной серией или картой меток liver_labels")
+    parser.add_argument("output", help="файл сетки (.stl, .ply или .obj)")
+    parser.add_argument("-t", "--triangles", type=int, default=DEFAULT_TARGET_TRIANGLES,
+                        help="целевое число треугольников (0 — без прореживания)")
+    parser.add_argument("--smooth", type=int, default=15, help="итераций сглаживания (0 — без сглаживания)")
+    args = parser.parse_args()
+
+    export_liver_mesh(args.folder, args.output, args.triangles, args.smooth)
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class SliceIndex:
+    """
+    Посрезовый индекс маски печени (z, y, x): число вокселей, площадь, центроид и
+    ограничивающий прямоугольник каждого среза плюс накопленные суммы вдоль z.
+    Объём слоя срезов, профиль «площадь от z» и показания движущейся плоскости
+    берутся из массивов без обхода объёма.
+    """
+
+    def __init__(self, mask, spacing):
+        """
+        :param mask: булева маска (z, y, x)
+        :param spacing: шаг сетки (dx, dy, dz) в мм
+        """
+        self.spacing = tuple(float(value) for value in spacing)
+        self.shape = mask.shape
+        self.counts, self.x_sums, self.y_sums, self.bboxes = self._compute(mask)
+        self.cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @staticmethod
+    def _compute(mask):
+        """
+        Статистика стопки срезов одним векторным проходом.
+        :return: counts (z,), суммы индексов x и y (z,), bbox (z, 4) = x0, x1, y0, y1 включительно, -1 для пустых
+        """
+        columns_hit = mask.sum(axis=1, dtype=np.int64)  # (z, x)
+        rows_hit = mask.sum(axis=2, dtype=np.int64)  # (z, y)
+        counts = columns_hit.sum(axis=1)
+        x_sums = columns_hit @ np.arange(mask.shape[2], dtype=np.int64)
+        y_sums = rows_hit @ np.arange(mask.shape[1], dtype=np.int64)
+
+        bboxes = np.full((mask.shape[0], 4), -1, dtype=np.int64)
+        filled = counts > 0
+        for column, hits in ((0, columns_hit > 0), (2, rows_hit > 0)):
+            first = hits.argmax(axis=1)
+            last = hits.shape[1] - 1 - hits[:, ::-1].argmax(axis=1)
+            bboxes[filled, column] = first[filled]
+            bboxes[filled, column + 1] = last[filled]
+        return counts, x_sums, y_sums, bboxes
+
+    def refresh(self, mask, k0, k1):
+        """
+        Пересчитывает срезы k0..k1 (включительно) после правки маски.
+        :param mask: вся актуальная маска (z, y, x) или её срезы k0..k1
+        """
+        block = mask[k0:k1 + 1] if mask.shape[0] == self.shape[0] else mask
+        counts, x_sums, y_sums, bboxes = self._compute(block)
+        self.counts[k0:k1 + 1] = counts
+        self.x_sums[k0:k1 + 1] = x_sums
+        self.y_sums[k0:k1 + 1] = y_sums
+        self.bboxes[k0:k1 + 1] = bboxes
+        np.cumsum(self.counts, out=self.cumulative[1:])
+
+    @property
+    def pixel_area_mm2(self):
+        return self.spacing[0] * self.spacing[1]
+
+    @property
+    def voxel_volume_mm3(self):
+        return self.spacing[0] * self.spacing[1] * self.spacing[2]
+
+    def slice_at(self, z_mm, origin_z=0.0):
+        """
+        Номер среза для координаты z в мм (ограничен размерами объёма).
+        """
+        k = int(round((z_mm - origin_z) / self.spacing[2]))
+        return min(max(k, 0), self.shape[0] - 1)
+
+    def area_mm2(self, k):
+        return float(self.counts[k] * self.pixel_area_mm2)
+
+    def centroid_mm(self, k):
+        """
+        Центроид печени на срезе k (x, y) в мм или None, если срез пуст.
+        """
+        if not self.counts[k]:
+            return None
+        return (float(self.x_sums[k] / self.counts[k] * self.spacing[0]),
+                float(self.y_sums[k] / self.counts[k] * self.spacing[1]))
+
+    def bbox(self, k):
+        """
+        Ограничивающий прямоугольник (x0, x1, y0, y1) в индексах вокселей или None.
+        """
+        return tuple(int(value) for value in self.bboxes[k]) if self.counts[k] else None
+
+    def slab_count(self, k0, k1):
+        """
+        Число вокселей печени в срезах [k0, k1); границы обрезаются по объёму.
+        """
+        k0 = min(max(k0, 0), self.shape[0])
+        k1 = min(max(k1, k0), self.shape[0])
+        return int(self.cumulative[k1] - self.cumulative[k0])
+
+    def slab_volume_mm3(self, k0, k1):
+        return self.slab_count(k0, k1) * self.voxel_volume_mm3
+
+    def total_volume_mm3(self):
+        return int(self.cumulative[-1]) * self.voxel_volume_mm3
+
+    def profile(self, origin_z=0.0):
+        """
+        :return: (z срезов в мм, площадь печени на срезе в мм²)
+        """
+        z_mm = origin_z + np.arange(self.shape[0]) * self.spacing[2]
+        return z_mm, self.counts * self.pixel_area_mm2
+
+    def plot_profile(self, ax=None, origin_z=0.0):
+        """
+        График площади печени по срезам и накопленного объёма.
+        :return: matplotlib Figure
+        """
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            _, ax = plt.subplots(figsize=(8, 4))
+        z_mm, areas = self.profile(origin_z)
+        ax.plot(z_mm, areas / 100.0, color="tab:red")
+        ax.set_xlabel("z, мм")
+        ax.set_ylabel("Площадь на срезе, см²")
+        cumulative_ax = ax.twinx()
+        cumulative_ax.plot(z_mm, self.cumulative[1:] * self.voxel_volume_mm3 / 1000.0, color="tab:blue", alpha=0.6)
+        cumulative_ax.set_ylabel("Накопленный объём, см³")
+        ax.set_title(f"Профиль печени: {round(self.total_volume_mm3() / 1000.0, 1)} см³")
+        return ax.figure
@@ -0,0 +1,80 @@
+import itertools
+
+import numpy as np
+
+
+class SummedVolumeTable:
+    """
+    3D-таблица накопленных сумм (integral image) булевой маски (z, y, x):
+    число вокселей маски в любом параллелепипеде считается за O(1) по 8 элементам таблицы.
+
+    Таблица на единицу больше маски по каждой оси (нулевые первые слои), int32 —
+    хватает на объёмы до 2^31 вокселей.
+    """
+
+    def __init__(self, mask):
+        depth, rows, columns = mask.shape
+        self.shape = mask.shape
+        self.table = np.zeros((depth + 1, rows + 1, columns + 1), dtype=np.int32)
+        inner = self.table[1:, 1:, 1:]
+        np.cumsum(mask, axis=0, dtype=np.int32, out=inner)
+        np.cumsum(inner, axis=1, out=inner)
+        np.cumsum(inner, axis=2, out=inner)
+
+    def total(self):
+        return int(self.table[-1, -1, -1])
+
+    def box_sum(self, z0, z1, y0, y1, x0, x1):
+        """
+        Число вокселей маски в [z0, z1) x [y0, y1) x [x0, x1); границы обрезаются по объёму.
+        """
+        depth, rows, columns = self.shape
+        z0, z1 = min(max(z0, 0), depth), min(max(z1, 0), depth)
+        y0, y1 = min(max(y0, 0), rows), min(max(y1, 0), rows)
+        x0, x1 = min(max(x0, 0), columns), min(max(x1, 0), columns)
+        if z0 >= z1 or y0 >= y1 or x0 >= x1:
+            return 0
+        t = self.table
+        return int(t[z1, y1, x1] - t[z0, y1, x1] - t[z1, y0, x1] - t[z1, y1, x0]
+                   + t[z0, y0, x1] + t[z0, y1, x0] + t[z1, y0, x0] - t[z0, y0, x0])
+
+    def mask_block(self, extent):
+        """
+        Текущая маска в экстенте (i0, i1, j0, j1, k0, k1) включительно, восстановленная из таблицы.
+        """
+        i0, i1, j0, j1, k0, k1 = extent
+        block = self.table[k0:k1 + 2, j0:j1 + 2, i0:i1 + 2]
+        return np.diff(np.diff(np.diff(block, axis=0), axis=1), axis=2)
+
+    def update(self, extent, mask):
+        """
+        Обновляет таблицу после правки маски в экстенте (i0, i1, j0, j1, k0, k1) включительно.
+        :param mask: новая маска этого экстента (z, y, x)
+
+        Изменение маски d влияет на все элементы таблицы «правее» экстента. Накопленные
+        суммы d внутри экстента прибавляются к его области, а за её пределами по каждой
+        оси — последний слой сумм с broadcasting (8 сочетаний «внутри/дальше» по осям),
+        без материализации массива размером с хвост таблицы.
+        """
+        i0, i1, j0, j1, k0, k1 = extent
+        delta = mask.astype(np.int32) - self.mask_block(extent)
+        if not delta.any():
+            return
+        np.cumsum(delta, axis=0, out=delta)
+        np.cumsum(delta, axis=1, out=delta)
+        np.cumsum(delta, axis=2, out=delta)
+
+        bounds = [(k0, k1), (j0, j1), (i0, i1)]
+        for beyond in itertools.product((False, True), repeat=3):
+            target = []
+            source = []
+            for (start, end), is_beyond in zip(bounds, beyond):
+                if is_beyond:
+                    target.append(slice(end + 2, None))
+                    source.append(slice(-1, None))
+                else:
+                    target.append(slice(start + 1, end + 2))
+                    source.append(slice(None))
+            region = self.table[tuple(target)]
+            if region.size:
+                region += delta[tuple(source)]
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.dicom_series import list_dicom_files
+from utils.mask_cache import file_fingerprint
+
+VOLUME_CACHE_DIR = ".volume_cache"
+# Поля геометрии read_series, которые хранятся в заголовке записи
+GEOMETRY_KEYS = ("dims", "spacing", "origin", "sources", "background_value")
+
+
+class VolumeCache:
+    """
+    Дисковый кэш прочитанных серий: сырой файл вокселей (z, y, x) и JSON-заголовок
+    с геометрией, dtype и отпечатками исходных файлов (имя, размер, mtime).
+
+    Повторное открытие серии отображает .raw в память вместо разбора DICOM:
+    страницы подгружаются по мере обращения. Запись при изменении, добавлении
+    или удалении любого среза считается устаревшей и пересобирается.
+    """
+
+    def __init__(self, cache_dir=VOLUME_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def paths(self, folder):
+        """
+        :return: (путь к .raw, путь к .json) для серии из папки folder
+        """
+        key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.raw", f"{base}.json"
+
+    @staticmethod
+    def fingerprints(folder):
+        return [file_fingerprint(file) for file in list_dicom_files(folder)]
+
+    def load(self, folder):
+        """
+        :return: (volume, geometry) или None, если записи нет или она устарела.
+            volume — np.memmap в режиме copy-on-write: правки кистью остаются в памяти
+            и не попадают в кэш.
+        """
+        raw_path, json_path = self.paths(folder)
+        try:
+            with open(json_path, encoding="utf-8") as f:
+                header = json.load(f)
+            raw_size = os.path.getsize(raw_path)
+        except (OSError, ValueError):
+            return None
+
+        dtype = np.dtype(header["dtype"])
+        shape = tuple(header["shape"])
+        if header["fingerprints"] != self.fingerprints(folder) or raw_size != int(np.prod(shape)) * dtype.itemsize:
+            return None
+        # Записи, сохранённые до появления поля в геометрии, пересобираются
+        if any(name not in header for name in GEOMETRY_KEYS):
+            return None
+
+        volume = np.memmap(raw_path, dtype=dtype, mode="c", shape=shape)
+        geometry = {name: header[name] for name in GEOMETRY_KEYS}
+        return volume, geometry
+
+    def store(self, folder, volume, geometry):
+        """
+        Сохраняет объём серии. Заголовок пишется последним, поэтому оборванная запись
+        просто не пройдёт проверку в load.
+        """
+        raw_path, json_path = self.paths(folder)
+        volume = np.ascontiguousarray(volume)
+        header = dict(geometry)
+        header.update({
+            "folder": os.path.abspath(folder),
+            "dtype": volume.dtype.str,
+            "shape": list(volume.shape),
+            "fingerprints": self.fingerprints(folder),
+        })
+
+        tmp_path = f"{raw_path}.tmp"
+        volume.tofile(tmp_path)
+        os.replace(tmp_path, raw_path)
+
+        tmp_path = f"{json_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, json_path)
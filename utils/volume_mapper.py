@@ -0,0 +1,90 @@
+import os
+
+import vtk
+
+RENDER_BACKENDS = ("auto", "gpu", "cpu", "smart")
+# Программные реализации OpenGL: GPU-маппер на них работает, но очень медленно
+SOFTWARE_GL_RENDERERS = ("llvmpipe", "softpipe", "swiftshader", "software rasterizer")
+
+# Целевая частота кадров при вращении; по ней CPU-маппер подбирает шаг по пикселям
+TARGET_INTERACTIVE_FPS = 15.0
+# Шаг луча задаётся в долях минимального шага сетки, шаг по пикселям — в пикселях экрана
+STILL_QUALITY = {"sample_distance": 0.5, "image_sample_distance": 1.0}
+INTERACTIVE_QUALITY = {"sample_distance": 2.0, "image_sample_distance": 2.0, "max_image_sample_distance": 4.0}
+
+
+def gl_renderer_name(render_window):
+    for line in render_window.ReportCapabilities().splitlines():
+        if line.startswith("OpenGL renderer string:"):
+            return line.split(":", 1)[1].strip()
+    return ""
+
+
+def gpu_supported(render_window):
+    """
+    Есть ли аппаратный OpenGL, на котором vtkGPUVolumeRayCastMapper может работать.
+    """
+    try:
+        if not gl_renderer_name(render_window):
+            # Контекст OpenGL создаётся при первом рендере окна
+            render_window.Render()
+        supported = vtk.vtkGPUVolumeRayCastMapper().IsRenderSupported(render_window, vtk.vtkVolumeProperty())
+        renderer_name = gl_renderer_name(render_window).lower()
+    except Exception as e:
+        print("Не удалось проверить поддержку GPU-рендеринга:", e)
+        return False
+    return bool(supported) and not any(name in renderer_name for name in SOFTWARE_GL_RENDERERS)
+
+
+def resolve_render_backend(backend, render_window):
+    """
+    Выбирает фактический бэкенд: auto — GPU при аппаратном OpenGL, иначе CPU;
+    gpu без поддержки откатывается на CPU.
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд рендеринга: {backend}, ожидается один из {RENDER_BACKENDS}")
+    if backend == "auto":
+        return "gpu" if gpu_supported(render_window) else "cpu"
+    if backend == "gpu" and not gpu_supported(render_window):
+        print("GPU-рендеринг недоступен, используется CPU ray casting")
+        return "cpu"
+    return backend
+
+
+def create_volume_mapper(backend):
+    """
+    :param backend: уже разрешённый бэкенд (gpu, cpu или smart)
+    """
+    if backend == "gpu":
+        return vtk.vtkGPUVolumeRayCastMapper()
+    if backend == "smart":
+        mapper = vtk.vtkSmartVolumeMapper()
+        mapper.SetRequestedRenderModeToDefault()
+        mapper.SetInteractiveUpdateRate(TARGET_INTERACTIVE_FPS)
+        return mapper
+    mapper = vtk.vtkFixedPointVolumeRayCastMapper()
+    mapper.SetNumberOfThreads(os.cpu_count() or 1)
+    return mapper
+
+
+def set_volume_quality(mapper, spacing, interactive):
+    """
+    Переключает качество маппера: во время перетаскивания — крупный шаг луча и
+    автоподбор шага по пикселям под TARGET_INTERACTIVE_FPS, в покое — полное качество.
+    :param spacing: шаг сетки объёма (dx, dy, dz)
+    """
+    quality = INTERACTIVE_QUALITY if interactive else STILL_QUALITY
+    sample_distance = min(spacing) * quality["sample_distance"]
+
+    if isinstance(mapper, vtk.vtkSmartVolumeMapper):
+        mapper.SetSampleDistance(sample_distance)
+        mapper.SetInteractiveAdjustSampleDistances(interactive)
+        return
+
+    mapper.SetSampleDistance(sample_distance)
+    mapper.SetImageSampleDistance(quality["image_sample_distance"])
+    mapper.SetMinimumImageSampleDistance(quality["image_sample_distance"])
+    mapper.SetMaximumImageSampleDistance(quality.get("max_image_sample_distance", quality["image_sample_distance"]))
+    if isinstance(mapper, vtk.vtkFixedPointVolumeRayCastMapper):
+        mapper.SetInteractiveSampleDistance(sample_distance)
+    mapper.SetAutoAdjustSampleDistances(interactive)
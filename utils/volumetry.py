@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from utils.dicom_series import list_dicom_files, read_series
+from utils.label_map import (LABEL_BACKGROUND, LABEL_LIVER, LABEL_NAMES, has_label_map, label_map_paths, liver_mask,
+                             read_label_map)
+from utils.mask_cache import file_fingerprint
+from utils.volume_cache import VOLUME_CACHE_DIR
+
+# Срезов в одной порции: ключи bincount (intp) занимают 8 байт на воксель порции
+CHUNK_SLICES = 8
+# Версия записей VolumetryCache: меняется вместе с определением печени для серий без карты меток
+VOLUMETRY_CACHE_VERSION = 2
+
+
+def measure_labels(labels, spacing, label_names=None, chunk_slices=CHUNK_SLICES):
+    """
+    Объёмы, площади поверхности и ограничивающие параллелепипеды всех меток за один
+    проход по объёму порциями срезов.
+
+    В каждой порции bincount по ключу (z, y, метка) даёт гистограмму, из которой
+    берутся число вокселей, экстенты по z и y, а по ключу (x, метка) — экстент по x.
+    Площадь — сумма граней вокселей на границе метки (с соседней меткой или краем
+    объёма); для гладкой поверхности она больше площади изоповерхности.
+
+    :param labels: целочисленные метки (z, y, x), можно np.memmap
+    :param spacing: шаг сетки (dx, dy, dz) в мм
+    :param label_names: {имя: значение}, по умолчанию LABEL_NAMES; метки без имени называются label_<n>
+    :return: {имя: {"label", "voxels", "volume_mm3", "volume_ml", "surface_mm2", "bbox"}} без фона;
+        bbox — [i0, i1, j0, j1, k0, k1] включительно или None для пустой метки
+    """
+    label_names = dict(LABEL_NAMES if label_names is None else label_names)
+    depth, rows, columns = labels.shape
+    dx, dy, dz = (float(value) for value in spacing)
+    bins = max(int(labels.max(initial=0)), *label_names.values()) + 1
+
+    zy_hist = np.zeros((depth, rows, bins), dtype=np.int64)
+    x_hist = np.zeros((columns, bins), dtype=np.int64)
+    surface = np.zeros(bins, dtype=np.float64)
+    x_offsets = np.arange(columns, dtype=np.intp) * bins
+
+    def add_faces(first, second, area):
+        """Грани между соседями first и second с разными метками — по одной каждой из меток."""
+        boundary = first != second
+        surface[:] += area * (np.bincount(first[boundary], minlength=bins) +
+                              np.bincount(second[boundary], minlength=bins))
+
+    previous = None
+    for k0 in range(0, depth, chunk_slices):
+        k1 = min(k0 + chunk_slices, depth)
+        block = np.asarray(labels[k0:k1]).astype(np.intp)
+
+        zy_offsets = (np.arange((k1 - k0) * rows, dtype=np.intp) * bins).reshape(k1 - k0, rows, 1)
+        zy_hist[k0:k1] = np.bincount((block + zy_offsets).ravel(),
+                                     minlength=(k1 - k0) * rows * bins).reshape(k1 - k0, rows, bins)
+        x_hist += np.bincount((block + x_offsets).ravel(), minlength=columns * bins).reshape(columns, bins)
+
+        add_faces(block[:, :, 1:], block[:, :, :-1], dy * dz)
+        add_faces(block[:, 1:, :], block[:, :-1, :], dx * dz)
+        add_faces(block[1:], block[:-1], dx * dy)
+        if previous is not None:
+            add_faces(block[0], previous, dx * dy)
+        previous = block[-1]
+
+        # Грани на краях объёма по x и y
+        for edge, area in ((block[:, :, 0], dy * dz), (block[:, :, -1], dy * dz),
+                           (block[:, 0, :], dx * dz), (block[:, -1, :], dx * dz)):
+            surface[:] += area * np.bincount(edge.ravel(), minlength=bins)
+    if depth:
+        for edge in (np.asarray(labels[0]), np.asarray(labels[-1])):
+            surface[:] += dx * dy * np.bincount(edge.astype(np.intp).ravel(), minlength=bins)
+
+    counts = zy_hist.sum(axis=(0, 1))
+    z_hits = zy_hist.sum(axis=1) > 0  # (z, метка)
+    y_hits = zy_hist.sum(axis=0) > 0  # (y, метка)
+    x_hits = x_hist > 0  # (x, метка)
+
+    names = {value: name for name, value in label_names.items()}
+    names.update({int(value): f"label_{value}" for value in np.flatnonzero(counts) if value not in names})
+    voxel_volume = dx * dy * dz
+    stats = {}
+    for value, name in sorted(names.items()):
+        if value == LABEL_BACKGROUND:
+            continue
+        bbox = None
+        if counts[value]:
+            bbox = [int(index) for hits in (x_hits, y_hits, z_hits)
+                    for index in (hits[:, value].argmax(), len(hits) - 1 - hits[::-1, value].argmax())]
+        stats[name] = {
+            "label": int(value),
+            "voxels": int(counts[value]),
+            "volume_mm3": float(counts[value] * voxel_volume),
+            "volume_ml": float(counts[value] * voxel_volume / 1000.0),
+            "surface_mm2": float(surface[value]),
+            "bbox": bbox,
+        }
+    return stats
+
+
+def labels_from_masked_volume(volume, background_value, threshold=None):
+    """
+    Карта печени из маскированной КТ, когда liver_labels ещё не записана: печень —
+    liver_mask (всё, кроме фона серии), или, если задан threshold, воксели с интенсивностью >= threshold.
+    """
+    mask = liver_mask(volume, background_value) if threshold is None else volume >= threshold
+    return mask.astype(np.uint8) * LABEL_LIVER
+
+
+def study_fingerprints(folder):
+    """
+    Отпечатки файлов, из которых считается волюметрия папки: карты меток или срезов DICOM.
+    """
+    files = label_map_paths(folder) if has_label_map(folder) else list_dicom_files(folder)
+    return [file_fingerprint(file) for file in files]
+
+
+class VolumetryCache:
+    """
+    Дисковый кэш результатов волюметрии (JSON на папку исследования рядом с VolumeCache).
+    Запись действительна, пока не изменились файлы карты меток / серии и порог.
+    """
+
+    def __init__(self, cache_dir=VOLUME_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, folder):
+        key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.volumetry.json")
+
+    def load(self, folder, threshold=None):
+        try:
+            with open(self.path(folder), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (entry.get("version") != VOLUMETRY_CACHE_VERSION or entry["fingerprints"] != study_fingerprints(folder)
+                or entry["threshold"] != threshold):
+            return None
+        return entry["result"]
+
+    def store(self, folder, result, threshold=None):
+        entry = {
+            "version": VOLUMETRY_CACHE_VERSION,
+            "folder": os.path.abspath(folder),
+            "threshold": threshold,
+            "fingerprints": study_fingerprints(folder),
+            "result": result,
+        }
+        tmp_path = f"{self.path(folder)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path(folder))
+
+
+def study_labels(folder, threshold=None):
+    """
+    :return: (метки (z, y, x), шаг сетки, {имя: значение}, источник "labels" или "dicom")
+    """
+    if has_label_map(folder):
+        labels, geometry = read_label_map(folder)
+        return labels, geometry["spacing"], geometry.get("labels", LABEL_NAMES), "labels"
+    volume, geometry = read_series(folder)
+    return (labels_from_masked_volume(volume, geometry["background_value"], threshold), geometry["spacing"],
+            LABEL_NAMES, "dicom")
+
+
+def measure_study(folder, threshold=None, cache=None):
+    """
+    Волюметрия одной папки исследования (карта меток или маскированная серия).
+    :param cache: VolumetryCache; при совпадении отпечатков файлов результат берётся из него
+    :return: {"study", "source", "labels": статистика measure_labels, "seconds", "cached"}
+    """
+    start_time = time.time()
+    result = cache.load(folder, threshold) if cache is not None else None
+    if result is None:
+        labels, spacing, label_names, source = study_labels(folder, threshold)
+        result = {
+            "study": os.path.abspath(folder),
+            "source": source,
+            "labels": measure_labels(labels, spacing, label_names),
+        }
+        if cache is not None:
+            cache.store(folder, result, threshold)
+        result["cached"] = False
+    else:
+        result["cached"] = True
+    result["seconds"] = round(time.time() - start_time, 3)
+    return result
+
+
+def find_studies(root):
+    """
+    Папки исследований: сам root, если в нём есть карта меток или срезы DICOM, иначе его подпапки с ними.
+    """
+    def is_study(folder):
+        return has_label_map(folder) or bool(list_dicom_files(folder))
+
+    if is_study(root):
+        return [root]
+    return [path for path in (os.path.join(root, name) for name in sorted(os.listdir(root)))
+            if os.path.isdir(path) and is_study(path)]
+
+
+def format_study(result):
+    lines = [f"{result['study']} ({result['source']}, {result['seconds']}с{', из кэша' if result['cached'] else ''})"]
+    for name, stats in result["labels"].items():
+        if stats["voxels"]:
+            lines.append(f"  {name}: {round(stats['volume_ml'], 2)} мл, поверхность "
+                         f"{round(stats['surface_mm2'] / 100.0, 1)} см², bbox {stats['bbox']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Объёмы печени и других меток по папке исследований")
+    parser.add_argument("root", help="папка исследования или папка с папками исследований")
+    parser.add_argument("--threshold", type=float,
+                        help="порог интенсивности для серий без карты меток (по умолчанию — всё, кроме фона)")
+    parser.add_argument("--json", action="store_true", help="вывести результаты в JSON")
+    parser.add_argument("--no-cache", action="store_true", help="не читать и не писать кэш результатов")
+    args = parser.parse_args()
+
+    volumetry_cache = None if args.no_cache else VolumetryCache()
+    results = [measure_study(folder, args.threshold, volumetry_cache) for folder in find_studies(args.root)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=1))
+    else:
+        for study_result in results:
+            print(format_study(study_result))
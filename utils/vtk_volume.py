@@ -0,0 +1,136 @@
+import multiprocessing
+import time
+
+import numpy as np
+import vtk
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from model.model import peak_memory_mb
+from utils.dicom_series import read_series
+from utils.label_map import has_label_map, liver_mask, masked_volume_from_labels, read_label_map
+
+
+def volume_to_vtk(volume, geometry):
+    """
+    Оборачивает объём (z, y, x) в vtkImageData без копирования: VTK работает
+    прямо с буфером NumPy (numpy_to_vtk хранит ссылку на массив, пока жив vtkDataArray).
+    """
+    image = vtk.vtkImageData()
+    image.SetDimensions(*geometry["dims"])
+    image.SetSpacing(*geometry["spacing"])
+    image.SetOrigin(*geometry["origin"])
+    scalars = numpy_to_vtk(volume.reshape(-1), deep=False)
+    image.GetPointData().SetScalars(scalars)
+    return image
+
+
+def vtk_volume_array(image):
+    """
+    NumPy-вид (z, y, x) на скаляры vtkImageData без копирования.
+    """
+    dims = image.GetDimensions()
+    return vtk_to_numpy(image.GetPointData().GetScalars()).reshape(dims[2], dims[1], dims[0])
+
+
+def liver_mask_to_vtk(liver_data, background_value):
+    """
+    Маска печени (liver_mask) как uint8-объём 0/1 с геометрией liver_data.
+    Буфер маски тот же, что у vtkImageData: правки через vtk_volume_array видны VTK.
+    """
+    mask = liver_mask(vtk_volume_array(liver_data), background_value)
+    return volume_to_vtk(mask.view(np.uint8), {
+        "dims": list(liver_data.GetDimensions()),
+        "spacing": list(liver_data.GetSpacing()),
+        "origin": list(liver_data.GetOrigin()),
+    })
+
+
+def benchmark_readers(folder="DICOM_DATASET", repeats=3):
+    """
+    Сравнивает vtkDICOMImageReader и read_series на одной серии.
+    :return: (секунды vtkDICOMImageReader, секунды read_series) — лучшее из repeats
+    """
+    vtk_times = []
+    numpy_times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        reader = vtk.vtkDICOMImageReader()
+        reader.SetDirectoryName(folder)
+        reader.Update()
+        vtk_times.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        volume, geometry = read_series(folder)
+        # Обёртка в vtkImageData входит в замер, как и выход vtkDICOMImageReader
+        volume_to_vtk(volume, geometry)
+        numpy_times.append(time.perf_counter() - start_time)
+
+    same = (vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars()) == volume.reshape(-1)).all()
+    print(f'vtkDICOMImageReader: {round(min(vtk_times), 3)}с, read_series: {round(min(numpy_times), 3)}с '
+          f'(x{round(min(vtk_times) / min(numpy_times), 1)}), объёмы совпадают: {bool(same)}')
+    return min(vtk_times), min(numpy_times)
+
+
+def _load_deep_copy(body_folder, liver_folder):
+    """
+    Прежняя загрузка: vtkDICOMImageReader и DeepCopy его выхода для каждой серии.
+    """
+    volumes = []
+    for folder in (body_folder, liver_folder):
+        reader = vtk.vtkDICOMImageReader()
+        reader.SetDirectoryName(folder)
+        reader.Update()
+        data = vtk.vtkImageData()
+        data.DeepCopy(reader.GetOutput())
+        volumes.append(data)
+    return volumes
+
+
+def _load_shared(body_folder, liver_folder):
+    """
+    Текущая загрузка (как в SeriesLoader): один NumPy-буфер на объём, обёрнутый без копии.
+    """
+    body, geometry = read_series(body_folder)
+    if has_label_map(liver_folder):
+        labels, label_geometry = read_label_map(liver_folder)
+        liver = masked_volume_from_labels(body, labels, label_geometry["background_value"])
+    else:
+        liver, _ = read_series(liver_folder)
+    return [volume_to_vtk(body, geometry), volume_to_vtk(liver, geometry)]
+
+
+_LOADERS = {"deep_copy": _load_deep_copy, "shared": _load_shared}
+
+
+def _measure_in_process(method, body_folder, liver_folder):
+    before = peak_memory_mb()
+    volumes = _LOADERS[method](body_folder, liver_folder)
+    after = peak_memory_mb()
+    size = sum(volume.GetPointData().GetScalars().GetActualMemorySize() for volume in volumes) / 1024
+    return before, after, size
+
+
+def measure_load_peak_rss(body_folder="DICOM_DATASET", liver_folder="DICOM_MASKED"):
+    """
+    Пиковый RSS загрузки двух серий прежним способом (DeepCopy) и текущим (общий буфер).
+    Каждый способ запускается в отдельном процессе, чтобы пики не смешивались.
+    :return: {способ: (пик до загрузки, пик после загрузки, объём данных) в МБ}
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for method in _LOADERS:
+        with context.Pool(1) as pool:
+            results[method] = pool.apply(_measure_in_process, (method, body_folder, liver_folder))
+        before, after, size = results[method]
+        print(f'{method}: пиковый RSS {round(after, 1)} МБ (+{round(after - before, 1)} МБ на загрузку, '
+              f'данные объёмов {round(size, 1)} МБ)')
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--rss" in sys.argv:
+        measure_load_peak_rss(*[arg for arg in sys.argv[1:] if arg != "--rss"][:2])
+    else:
+        benchmark_readers(*sys.argv[1:2])